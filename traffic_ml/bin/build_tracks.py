@@ -0,0 +1,64 @@
+# MIT License
+#
+# Copyright (c) 2023 MEng-Team-Project
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+"""Build the detection indexes and per-track summary table of existing
+analysis databases, which let the microservice answer filtered, paged and
+whole-video requests without reading every detection, and their columnar
+detection sidecars, which let it load full detection tables without
+converting them from SQLite."""
+
+from pathlib import Path
+
+from absl import app
+from absl import flags
+
+from traffic_ml.lib.db      import ensure_indexes, build_tracks
+from traffic_ml.lib.sidecar import write_sidecar
+
+FLAGS = flags.FLAGS
+flags.DEFINE_string ("analysis_dir", None, "Directory containing the analysis DBs")
+flags.DEFINE_list   ("streams", None, "(Optional) Stream IDs to summarise, defaults to all")
+flags.mark_flag_as_required("analysis_dir")
+
+def main(unused_argv):
+    analysis_dir = Path(FLAGS.analysis_dir)
+    if FLAGS.streams:
+        paths = [analysis_dir / f"{stream}.db" for stream in FLAGS.streams]
+    else:
+        paths = sorted(analysis_dir.glob("*.db"))
+
+    for path in paths:
+        if not path.exists():
+            print(f"{path.stem}: no analysis database")
+            continue
+        ensure_indexes(path)
+        n_tracks = build_tracks(path)
+        n_rows   = write_sidecar(path)
+        if n_tracks is None or n_rows is None:
+            print(f"{path.stem}: failed")
+        else:
+            print(f"{path.stem}: {n_tracks} tracks, {n_rows} detections")
+
+def entry_point():
+    app.run(main)
+
+if __name__ == "__main__":
+    app.run(main)
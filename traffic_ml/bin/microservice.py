@@ -23,26 +23,50 @@
 video footage for identification, count and route tracking of vehicles
 and people."""
 
+import concurrent.futures
+import functools
 import logging
 import os
-import subprocess
 from pathlib import Path
 import pandas as pd
-import sqlite3
-import json
 import numpy as np
 
-from shapely.geometry import Point, Polygon
-
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify
 
 from absl import app as absl_app
 from absl import flags
 
+from traffic_ml.lib.cache import LRUCache, StreamCache, file_version, content_hash
+from traffic_ml.lib.db    import ConnectionPool, ensure_indexes, read_detections, filter_detections, read_metadata, \
+    read_tracks, build_tracks, summarise_tracks, detection_watermark, appended_since, watermark_rowid, \
+    read_detection_page, read_track_detections
+from traffic_ml.lib.trajectory import add_anchors, track_endpoints, merge_endpoints, routes_by_label, \
+    endpoint_routes_by_label, page_order, endpoint_page
+from traffic_ml.lib.regions    import region_polygons, regions_hash, classify_points, RegionMap
+from traffic_ml.lib.jobs       import JobQueue
+from traffic_ml.lib.serving    import serve
+from traffic_ml.lib.metrics    import REGISTRY, StageTimer
+from traffic_ml.lib.profiling  import profile_call, top_functions, write_profile
+from traffic_ml.lib.export     import EXPORT_FORMATS, available_formats, format_for_mimetype, export_table
+from traffic_ml.lib.serialize  import dumps, iter_records, iter_object, encode_cursor, decode_cursor
+from traffic_ml.lib.analytics  import arrow_to_us, us_to_arrow, assign_intervals, route_counts
+from traffic_ml.lib.rollup     import RouteRollup, track_routes
+from traffic_ml.lib.sidecar    import read_sidecar, write_sidecar
+
 FLAGS = flags.FLAGS
 flags.DEFINE_string ("host", "localhost", "Host IP")
 flags.DEFINE_integer("port", 6000, "Host port")
 flags.DEFINE_string ("analysis_dir", None, "Directory to save analysis DBs to")
+flags.DEFINE_integer("cache_mb", 1024, "Memory limit of the shared stream table cache (MB)")
+flags.DEFINE_integer("analysis_workers", 1, "Number of stream analyses run at once")
+flags.DEFINE_integer("max_page_size", 10000, "Maximum number of rows or tracks in a page of /api/analysis/")
+flags.DEFINE_integer("workers", 1, "Number of worker processes (requires gunicorn)")
+flags.DEFINE_integer("threads", 1, "Number of threads per worker process")
+flags.DEFINE_list   ("preload", [], "Streams whose detection tables are loaded before serving")
+flags.DEFINE_integer("batch_workers", 8, "Number of streams of an /api/analysis/batch request processed at once")
+flags.DEFINE_integer("max_db_connections", 64, "Maximum number of open read-only analysis database connections")
+flags.DEFINE_bool   ("profile_requests", False, "Allow analytics requests to set `profile` to be run under cProfile")
+flags.DEFINE_string ("profile_dir", None, "Directory to write request profiles to, instead of returning them")
 
 flags.mark_flag_as_required("analysis_dir")
 
@@ -51,7 +75,340 @@ app = Flask(__name__)
 OFFLINE_ANALYSIS = lambda source, analysis_path, half: \
     f'python yolov8_tracking/track.py --source {source} --save-vid --save-trajectories --yolo-weights yolov8l.pt --tracking-method strongsort --analysis_db_path {analysis_path} {"--half" if half else ""}'
 
+def json_response(obj, precision=None, status=200):
+    """JSON response encoded directly from any nested pandas and NumPy
+    values, optionally with floats rounded to `precision` decimal places."""
+    return Response(dumps(obj, precision), status=status, mimetype="application/json")
+
+def profiled(view):
+    """Run an analytics endpoint under cProfile if the request sets `profile`
+    and profiling is allowed by `--profile_requests`. The profile is written
+    to `--profile_dir` (named in the `X-Profile-File` header) if set.
+    Otherwise the top cumulative time functions are returned alongside the
+    result, as `{"profile": [...], "result": ...}`."""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        content = request.get_json(silent=True)
+        if not isinstance(content, dict) or not content.get("profile"):
+            return view(*args, **kwargs)
+        if not FLAGS.profile_requests:
+            return jsonify("Error: Profiling is disabled, see --profile_requests"), 403
+
+        def run():
+            response = app.make_response(view(*args, **kwargs))
+            response.get_data() # Streamed responses are encoded while profiling
+            return response
+        response, profiler = profile_call(run)
+
+        if FLAGS.profile_dir:
+            name = f"{view.__name__}-{Path(str(content.get('stream'))).name}"
+            path = write_profile(profiler, FLAGS.profile_dir, name)
+            logging.info("Wrote profile of %s to %s", request.path, path)
+            response.headers["X-Profile-File"] = path
+        else:
+            response.set_data(
+                b'{"profile":' + dumps(top_functions(profiler)) +
+                b',"result":' + response.get_data() + b'}')
+        return response
+    return wrapper
+
+def response_etag(view_name, content, headers=None):
+    """ETag of the response to a request, from the versions of the stream
+    databases it reads, its canonical parameters and the values of any
+    `headers` the response is negotiated from. None if a database doesn't
+    exist."""
+    streams  = content.get("streams") if "streams" in content else [content.get("stream")]
+    versions = [file_version(Path(FLAGS.analysis_dir) / f"{stream}.db") for stream in streams]
+    if any(version is None for version in versions):
+        return None
+    # Hashed on its own so the body's fields are in canonical order too
+    key = {"view": view_name, "versions": versions, "content": content_hash(content)}
+    if headers:
+        key["headers"] = headers
+    return content_hash(key)
+
+def conditional(view=None, vary=()):
+    """Tag successful responses of an endpoint with an ETag, see
+    `response_etag`. Requests with a matching `If-None-Match` header get an
+    empty `304` response without running the endpoint, as long as the
+    stream databases haven't changed. Endpoints which negotiate their
+    response from request headers, e.g. `Accept`, list them in `vary`."""
+    if view is None:
+        return functools.partial(conditional, vary=vary)
+
+    def respond(*args, **kwargs):
+        content = request.get_json(silent=True)
+        if not isinstance(content, dict) or content.get("profile"):
+            return app.make_response(view(*args, **kwargs))
+        headers = {header: request.headers.get(header) for header in vary}
+        etag    = response_etag(view.__name__, content, headers)
+        if etag is None:
+            return app.make_response(view(*args, **kwargs))
+        if request.if_none_match.contains(etag):
+            response = Response(status=304)
+            response.set_etag(etag)
+            return response
+
+        response = app.make_response(view(*args, **kwargs))
+        if response.status_code == 200:
+            response.set_etag(etag)
+        return response
+
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        response = respond(*args, **kwargs)
+        if vary:
+            response.vary.update(vary)
+        return response
+    return wrapper
+
+# Read-only connections to the analysis databases, reused between requests
+DB_POOL = ConnectionPool()
+
+def load_tables(analysis_path, start=None, end=None, classes=None):
+    """Read the (optionally filtered) detection table and the metadata table
+    of an analysis database, along with the watermark of the last
+    detection read. Full tables are loaded from the stream's sidecar if it
+    has been written, with only the detections written since read from
+    SQLite, see `sidecar.read_sidecar`."""
+    with DB_POOL.connection(analysis_path) as con:
+        watermark = detection_watermark(con)
+        sidecar   = None
+        if start is None and end is None and classes is None:
+            sidecar = read_sidecar(analysis_path, con)
+        if sidecar is None:
+            detections_df = read_detections(
+                con, start, end, classes, until=watermark_rowid(watermark))
+        else:
+            detections_df, sidecar_watermark = sidecar
+            new_df = read_detections(
+                con, after=watermark_rowid(sidecar_watermark), until=watermark_rowid(watermark))
+            if len(detections_df) == 0:
+                detections_df = new_df
+            elif len(new_df) > 0:
+                detections_df = pd.concat([detections_df, new_df], ignore_index=True)
+        metadata_df = read_metadata(con)
+    return detections_df, metadata_df, watermark
+
+def extend_tables(analysis_path, tables, start=None, end=None, classes=None):
+    """Add the detections written since `tables` were loaded by
+    `load_tables`. Returns None if the database has been rewritten."""
+    detections_df, _, watermark = tables
+    with DB_POOL.connection(analysis_path) as con:
+        if not appended_since(con, watermark):
+            return None
+        latest = detection_watermark(con)
+        new_df = read_detections(
+            con, start, end, classes,
+            after=watermark_rowid(watermark), until=watermark_rowid(latest))
+        metadata_df = read_metadata(con)
+    if len(detections_df) == 0:
+        detections_df = new_df
+    elif len(new_df) > 0:
+        detections_df = pd.concat([detections_df, new_df], ignore_index=True)
+    return detections_df, metadata_df, latest
+
+def load_tracks(analysis_path):
+    """Read the track summary table and the metadata table of an analysis
+    database, along with the watermark of the last detection summarised.
+    Tracks are summarised from the detection table if the summary table has
+    not been built, and detections written after it was built are added."""
+    with DB_POOL.connection(analysis_path) as con:
+        watermark = detection_watermark(con)
+        tracks    = read_tracks(con)
+        if tracks is None:
+            tracks_df = summarise_tracks(con, until=watermark_rowid(watermark))
+        else:
+            tracks_df, rowid = tracks
+            tracks_df = merge_endpoints(tracks_df, summarise_tracks(
+                con, after=rowid, until=watermark_rowid(watermark)))
+        metadata_df = read_metadata(con)
+    return tracks_df, metadata_df, watermark
+
+def extend_tracks(analysis_path, tracks):
+    """Add the detections written since `tracks` were loaded by
+    `load_tracks`. Returns None if the database has been rewritten."""
+    tracks_df, _, watermark = tracks
+    with DB_POOL.connection(analysis_path) as con:
+        if not appended_since(con, watermark):
+            return None
+        latest    = detection_watermark(con)
+        tracks_df = merge_endpoints(tracks_df, summarise_tracks(
+            con, after=watermark_rowid(watermark), until=watermark_rowid(latest)))
+        metadata_df = read_metadata(con)
+    return tracks_df, metadata_df, latest
+
+# Detection and metadata tables are shared between requests. When the
+# stream's database changes on disk, only the detections written since are
+# read, unless the database has been rewritten. Cached tables must be
+# treated as read-only by the endpoints.
+STREAM_CACHE = StreamCache(1024 * 1024 * 1024, load_tables, extend_tables)
+
+def get_tables(stream, start=None, end=None, classes=None):
+    """Get the (detections_df, metadata_df) tables for a stream. Detections
+    are optionally filtered by start and end frame and class labels."""
+    analysis_path = Path(FLAGS.analysis_dir) / f"{stream}.db"
+    if start is None and end is None and classes is None:
+        return STREAM_CACHE.get(stream, analysis_path)[:2]
+
+    # Filter an already loaded full table in memory, otherwise push the
+    # filters down into SQLite so only the matching rows are read
+    tables = STREAM_CACHE.peek(stream, analysis_path)
+    if tables is not None:
+        detections_df, metadata_df, _ = tables
+        return filter_detections(detections_df, start, end, classes), metadata_df
+
+    if classes is not None:
+        classes = tuple(sorted(set(classes)))
+    return STREAM_CACHE.get(stream, analysis_path, start, end, classes)[:2]
+
+# Per-track summaries, which are far smaller than the detection tables and
+# are updated in the same way
+TRACK_CACHE = StreamCache(256 * 1024 * 1024, load_tracks, extend_tracks)
+
+def get_tracks(stream, classes=None):
+    """Get the (tracks_df, metadata_df) tables for a stream, with tracks
+    optionally filtered by class labels. See `db.summarise_tracks`."""
+    analysis_path = Path(FLAGS.analysis_dir) / f"{stream}.db"
+    tracks_df, metadata_df, _ = TRACK_CACHE.get(stream, analysis_path)
+    if classes is not None:
+        tracks_df = tracks_df[tracks_df["label"].isin(classes)]
+    return tracks_df, metadata_df
+
+# Rasterized route region label images, keyed by region set and grid size
+REGION_MAP_CACHE = LRUCache(256 * 1024 * 1024)
+
+def region_classifier(content, metadata_df):
+    """Get a function `classify(xs, ys)` which labels points with the route
+    region they lie in. If the request sets `rasterize`, the regions are
+    rasterized once into a cached label image at the stream's resolution,
+    scaled by the optional `raster_scale`. Raises a ValueError if the scale
+    is not positive or the image would be too large, see `RegionMap`."""
+    regions = content["regions"]
+    if not content.get("rasterize"):
+        region_polys = region_polygons(regions)
+        return lambda xs, ys: classify_points(xs, ys, region_polys)
+
+    if "width" in metadata_df and "height" in metadata_df:
+        width, height = int(metadata_df["width"]), int(metadata_df["height"])
+    else:
+        # Points outside of every region's bounds can't be in any region
+        coords = np.array([xy for poly in regions.values() for xy in poly], dtype=float)
+        width, height = coords.max(axis=0) + 1
+    scale = float(content.get("raster_scale", 1.0))
+
+    key = (regions_hash(regions), int(width), int(height), scale)
+    region_map = REGION_MAP_CACHE.get(key)
+    if region_map is None:
+        region_map = RegionMap(regions, width, height, scale)
+        REGION_MAP_CACHE.put(key, region_map, region_map.nbytes)
+    return region_map.classify
+
+# Route analytics responses, keyed by stream and request body and dropped
+# when the stream's database changes
+ANALYTICS_CACHE = LRUCache(128 * 1024 * 1024)
+
+def get_metadata(stream):
+    """Read the metadata table of a stream."""
+    with DB_POOL.connection(Path(FLAGS.analysis_dir) / f"{stream}.db") as con:
+        return read_metadata(con)
+
+def rollup_query(content, fps):
+    """Hashable cache key part of the region set and frame rate of a route
+    analytics request, see `load_rollup`."""
+    regions = tuple((name, tuple(tuple(float(v) for v in xy) for xy in coords))
+                    for name, coords in content["regions"].items())
+    return (regions, bool(content.get("rasterize")),
+            float(content.get("raster_scale", 1.0)), float(fps))
+
+def rollup_classifier(query, metadata_df):
+    """Region classifier of a `rollup_query`."""
+    regions, rasterize, raster_scale, _ = query
+    content = {"regions":      {name: [list(xy) for xy in coords] for name, coords in regions},
+               "rasterize":    rasterize,
+               "raster_scale": raster_scale}
+    return region_classifier(content, metadata_df)
+
+def load_rollup(analysis_path, *query):
+    """Roll up the route state of every track of an analysis database for
+    a `rollup_query`, along with the watermark of the last detection
+    rolled up. Built from the stream's track summaries."""
+    tracks_df, metadata_df, watermark = TRACK_CACHE.get(analysis_path.stem, analysis_path)
+    classify = rollup_classifier(query, metadata_df)
+    return RouteRollup(track_routes(tracks_df, classify, query[-1])), watermark
+
+def extend_rollup(analysis_path, rollup, *query):
+    """Add the detections written since `rollup` was loaded by
+    `load_rollup`. Only the tracks with new detections are summarised and
+    rolled up again. Returns None if the database has been rewritten."""
+    rollup, watermark = rollup
+    with DB_POOL.connection(analysis_path) as con:
+        if not appended_since(con, watermark):
+            return None
+        latest = detection_watermark(con)
+        new_df = summarise_tracks(
+            con, after=watermark_rowid(watermark), until=watermark_rowid(latest))
+        metadata_df = read_metadata(con)
+    classify = rollup_classifier(query, metadata_df)
+    return rollup.extend(track_routes(new_df, classify, query[-1])), latest
+
+# Rollups of the route state of every track, keyed by stream, region set
+# and frame rate. When the stream's database grows, only the tracks with
+# new detections are rolled up again.
+ROLLUP_CACHE = StreamCache(256 * 1024 * 1024, load_rollup, extend_rollup)
+
+def get_rollup(stream, content, fps, timer):
+    """Get the `RouteRollup` of a stream's tracks for the request's region
+    set, which is built on the first request for it."""
+    analysis_path = Path(FLAGS.analysis_dir) / f"{stream}.db"
+    rollup, _ = ROLLUP_CACHE.get(stream, analysis_path, *rollup_query(content, fps))
+    timer.lap("rollup", rows=len(rollup.routes))
+    return rollup
+
+def all_cache_stats():
+    return {
+        "streams":        STREAM_CACHE.stats(),
+        "tracks":         TRACK_CACHE.stats(),
+        "region_maps":    REGION_MAP_CACHE.stats(),
+        "analytics":      ANALYTICS_CACHE.stats(),
+        "rollups":        ROLLUP_CACHE.stats(),
+        "pages":          PAGE_CACHE.stats(),
+        "db_connections": DB_POOL.stats()
+    }
+
+@REGISTRY.collector
+def cache_metrics():
+    """Cache statistics as Prometheus metrics, labelled by cache."""
+    stats   = all_cache_stats()
+    metrics = []
+    for key, metric_type, documentation in [
+            ("hits",       "counter", "Cache lookups which found a valid entry."),
+            ("misses",     "counter", "Cache lookups which had to load the value."),
+            ("extensions", "counter", "Cached stream tables extended with new detections."),
+            ("evictions",  "counter", "Entries evicted to stay within the memory limit."),
+            ("entries",    "gauge",   "Number of cached entries."),
+            ("bytes",      "gauge",   "Estimated memory used by cached entries."),
+            ("max_bytes",  "gauge",   "Memory limit of the cache.")]:
+        name    = f"traffic_ml_cache_{key}" + ("_total" if metric_type == "counter" else "")
+        samples = [({"cache": cache}, cache_stats[key])
+                   for cache, cache_stats in stats.items() if key in cache_stats]
+        metrics.append((name, metric_type, documentation, samples))
+    return metrics
+
+@app.route("/api/cache/", methods=["GET"])
+def cache_stats():
+    """Get hit, miss and memory usage statistics of the shared caches."""
+    return jsonify(all_cache_stats())
+
+@app.route("/api/metrics", methods=["GET"])
+def metrics():
+    """Get per-stage latency histograms, processed row counters and cache
+    statistics in the Prometheus text exposition format."""
+    return Response(REGISTRY.render(), mimetype="text/plain; version=0.0.4")
+
 @app.route("/api/routes/", methods=["POST"])
+@profiled
+@conditional
 def routes():
     """Get per object count for each supplied route region
     
@@ -61,7 +418,11 @@ def routes():
         start   - (Optional) Start frame
         end     - (Optional) End frame
         classes - (Optional) List of COCO class labels to filter detections by
+        rasterize    - (Optional) Label points using a cached raster of the regions
+        raster_scale - (Optional) Raster grid cells per pixel (default 1.0)
+        precision    - (Optional) Decimal places to round coordinates to
     """
+    timer = StageTimer("routes")
     try:
         # Get stream ID
         content = request.json
@@ -70,117 +431,46 @@ def routes():
 
         # Check route info
         if not "regions" in content:
+            timer.finish("error")
             return jsonify("Error: Route region polygons required"), 400
 
-        # Get SQLite detection data
-        analysis_path = Path(FLAGS.analysis_dir) / f"{stream}.db"
-        con = sqlite3.connect(analysis_path)
-        detections_df = pd.read_sql_query("SELECT * FROM detection;", con)
-        metadata_df   = pd.read_sql_query("SELECT * FROM metadata;", con)
-        metadata_df   = metadata_df.iloc[0]
-        if "id" in metadata_df:
-            del metadata_df["id"]
-        con.close()
-
-        # (Optional) Apply start and end frame filters
-        data = detections_df
-        if "start" in content:
-            data = data[data["frame"] >= content["start"]]
-        if "end" in content:
-            data = data[data["frame"] <= content["end"]]
-        if "classes" in content:
-            classes = content["classes"]
-            data    = data[data["label"].isin(classes)]
-        
-        # NOTE: SAME TILL HERE
-        routes_df = data[["frame", "label", "det_id", "bbox_x", "bbox_y", "bbox_w", "bbox_h"]].copy()
-        routes_df["anchor_x"] = routes_df.apply(
-            lambda row: row["bbox_x"] + (row["bbox_w"] / 2.0), axis=1)
-        routes_df["anchor_y"] = routes_df.apply(
-            lambda row: row["bbox_y"] + (row["bbox_h"] / 2.0), axis=1)
-
-        def get_values(group):
-            return group[['anchor_x', 'anchor_y']].values.tolist()
-
-        entire_routes = routes_df.groupby(['label', 'det_id']).apply(get_values)
-
-
-        import json
-        trk_fmt = "first_last"
-
-        def get_values(group, trk_fmt):
-            vals = group[['frame', 'anchor_x', 'anchor_y']].values.tolist()
-            if trk_fmt == "first_last":
-                vals = [vals[0], vals[-1]]
-            vals = [{"frame:": val[0], "x": val[1], "y": val[2]} for val in vals]
-            return vals
-
-        routes = routes_df.groupby(['label', 'det_id']).apply(
-                    lambda group: get_values(group, trk_fmt))
-
-        # Reset the index of the resulting series to remove the MultiIndex
-        routes = routes.reset_index()
-
-        # Replace the MultiIndex label column names with 'label' and 'det_id'
-        routes.rename(columns={0: 'routes'}, inplace=True)
-        routes.rename(columns={'level_0': 'label', 'level_1': 'det_id'}, inplace=True)
-
-        # Create a dictionary with 'label' as the key and 'routes' as the value
-        route_dict = routes.groupby('label')['routes'].apply(list).to_dict()
-
-        # 1. Get start and end pos for each unique object during entire video
-        start_end_df = entire_routes.copy()
-        start_end_df = start_end_df.reset_index()
-
-        overlap_start_df = start_end_df.copy()[["label", "det_id"]]
-        overlap_end_df = start_end_df.copy()[["label", "det_id"]]
-
-        start_end_df["start_x"] = start_end_df.apply(lambda row: row[0][0][0],  axis=1)
-        start_end_df["start_y"] = start_end_df.apply(lambda row: row[0][0][1],  axis=1)
-        start_end_df["end_x"]   = start_end_df.apply(lambda row: row[0][-1][0], axis=1)
-        start_end_df["end_y"]   = start_end_df.apply(lambda row: row[0][-1][1], axis=1)
-        if 0 in start_end_df:
-            del start_end_df[0]
-
-        # 2. Get overlaps between start and end, and each region
-        ROUTE_REGIONS = content["regions"]
-        for route_region in ROUTE_REGIONS.keys():
-            cur_polygon = Polygon(ROUTE_REGIONS[route_region])
-
-            # Start Geometry
-            start_geometry = [Point(x, y) for x, y in zip(start_end_df["start_x"], start_end_df["start_y"])]
-
-            # Start Overlap
-            start_end_df[f"{route_region}_start_overlap"] = [point.within(cur_polygon) for point in start_geometry]
-            overlap_start_df[route_region]                = start_end_df[f"{route_region}_start_overlap"]
-
-            # End Geometry
-            end_geometry = [Point(x, y) for x, y in zip(start_end_df["end_x"], start_end_df["end_y"])]
-
-            # End Overlap
-            start_end_df[f"{route_region}_end_overlap"] = [point.within(cur_polygon) for point in end_geometry]
-            overlap_end_df[route_region]                = start_end_df[f"{route_region}_end_overlap"]
-
-        def label_overlap(row):
-            for i in range(len(row)):
-                if row[i]:
-                    return overlap_start_df.columns[2:][i]
-            return np.nan
-
-        overlap_start_df['overlap_label'] = overlap_start_df.iloc[:, 2:].apply(label_overlap, axis=1)
-        overlap_end_df['overlap_label'] = overlap_end_df.iloc[:, 2:].apply(label_overlap, axis=1)
-
-        overlap_df = start_end_df.iloc[:, :2]
-        overlap_df["start"] = overlap_start_df["overlap_label"]
-        overlap_df["end"]   = overlap_end_df["overlap_label"]
-
-        overlap = json.loads(overlap_df.to_json(orient="records"))
-        return jsonify(overlap)
+        # 1. Get start and end pos for each unique object during entire
+        # video, from the track summaries if possible. Otherwise from the
+        # SQLite detection data, (optionally) filtered by start and end
+        # frame and class labels
+        if content.get("start") is None and content.get("end") is None:
+            start_end_df, metadata_df = get_tracks(stream, content.get("classes"))
+            timer.lap("load", rows=len(start_end_df))
+        else:
+            data, metadata_df = get_tables(
+                stream, content.get("start"), content.get("end"), content.get("classes"))
+            timer.lap("load", rows=len(data))
+
+            # Anchor point of each detection
+            routes_df    = add_anchors(data[["frame", "label", "det_id", "bbox_x", "bbox_y", "bbox_w", "bbox_h"]])
+            start_end_df = track_endpoints(routes_df)
+            timer.lap("anchors", rows=len(routes_df))
+        start_end_df = start_end_df[["label", "det_id", "start_x", "start_y", "end_x", "end_y"]]
+
+        # 2. Label start and end pos with the first region they overlap
+        classify   = region_classifier(content, metadata_df)
+        overlap_df = start_end_df[["label", "det_id"]].copy()
+        overlap_df["start"] = classify(start_end_df["start_x"], start_end_df["start_y"])
+        overlap_df["end"]   = classify(start_end_df["end_x"],   start_end_df["end_y"])
+        timer.lap("regions", rows=2 * len(overlap_df))
+
+        response = json_response(overlap_df, content.get("precision"))
+        timer.lap("encode")
+        timer.finish()
+        return response
 
     except Exception as e:
+        timer.finish("error")
         return jsonify("Error:", str(e)), 400
 
 @app.route("/api/routeAnalytics/", methods=["POST"])
+@profiled
+@conditional
 def routeAnalytics():
     """ Aggregate analytic data from specific database file and filtered for
         frontend 
@@ -195,13 +485,13 @@ def routeAnalytics():
         end_regions         - (Optional) List of end regions to filter by (default all)
         interval_spacing    - (Optional) Interval spacing to split up detections by (secs)
         fps                 - (Optional) FPS to timestamp each frame
+        rasterize           - (Optional) Label points using a cached raster of the regions
+        raster_scale        - (Optional) Raster grid cells per pixel (default 1.0)
+        precision           - (Optional) Decimal places to round times to
     """
+    timer = StageTimer("routeAnalytics")
     try:
         import arrow 
-        import sqlite3
-        import pandas as pd
-        import numpy as np
-        from shapely.geometry import Point, Polygon
 
         # Get stream ID
         content = request.json
@@ -212,6 +502,7 @@ def routeAnalytics():
         args = ['stream', 'regions', 'classes', 'start_time']
         for arg in args:
             if arg not in content:
+                timer.finish("error")
                 return jsonify(f"Error: {arg.title()} required"), 400
 
         # Main constant assignments
@@ -235,242 +526,36 @@ def routeAnalytics():
         else:
             INTERVAL_SPACING = None
 
+        # Reuse the response to an identical earlier request, unless the
+        # stream's database has changed since
+        version   = file_version(Path(FLAGS.analysis_dir) / f"{stream}.db")
+        cache_key = (stream, content_hash(content))
+        cached    = ANALYTICS_CACHE.get(cache_key, valid=lambda entry: entry[0] == version)
+        timer.lap("cache")
+        if cached is not None:
+            response = json_response(cached[1], content.get("precision"))
+            timer.lap("encode")
+            timer.finish("cached")
+            return response
+
+        metadata_df = get_metadata(stream)
+
+        ## Get FPS from request, otherwise from metadata
+        if 'fps' in content:
+            FPS = content['fps']
+        elif 'fps' in metadata_df:
+            FPS = metadata_df['fps']
+        else:
+            FPS = 30 # Default FPS value
 
-        # Get SQLite detection data
-        analysis_path = Path(FLAGS.analysis_dir) / f"{stream}.db"
-        print(analysis_path.absolute())
-        con = sqlite3.connect(analysis_path)
-        
-        detections_df = pd.read_sql_query("SELECT * FROM detection;", con)
-        detections_df = detections_df.reindex(columns=['frame', 'label', 'det_id', 'bbox_x', 'bbox_y', 'bbox_w', 'bbox_h'])
-
-        ## Get FPS from metadata
-        if 'fps' not in content:
-            metadata_df = pd.read_sql_query("SELECT * FROM metadata;", con)
-            metadata_df = metadata_df.iloc[0]
-            if 'fps' in metadata_df:
-                FPS = metadata_df['fps']
-            else:
-                FPS = 30 # Default FPS value
-            
-        con.close()
-                
-        ### Detection Count (per Frame)
-        ### Change Frames to Timestamps
-        def newTimestamp(timestamp, frame, fps):
-            return timestamp.shift(microseconds=1000000/fps * frame)
-
-        # Change frames to timestamps
-        detections_df['frame'] = detections_df.apply(
-            lambda row: newTimestamp(TIME_OF_RECORDING, int(row["frame"]), FPS), 
-            axis=1
-        )
-        detections_df = detections_df.rename(columns={'frame':'timestamp'})
-        data = detections_df
-
-        ### Object Count
-        ### Object Tracking
-        routes_df = data[["timestamp", "label", "det_id", "bbox_x", "bbox_y", "bbox_w", "bbox_h"]].copy()
-        routes_df["anchor_x"] = routes_df.apply(
-            lambda row: row["bbox_x"] + (row["bbox_w"] / 2.0), axis=1)
-        routes_df["anchor_y"] = routes_df.apply(
-            lambda row: row["bbox_y"] + (row["bbox_h"] / 2.0), axis=1)
-
-        #### Either First and Last, or all Anchor Points for Each (label, det_id) Tuple
-        def get_values(group):
-            return group[['anchor_x', 'anchor_y']].values.tolist()
-
-        entire_routes = routes_df.groupby(['label', 'det_id']).apply(get_values)
-        ### Object Tracking (Start and Finish Regions)
-        # 1. Get start and end pos for each unique object during entire video
-        start_end_df = entire_routes.copy()
-        start_end_df = start_end_df.reset_index()
-
-        overlap_start_df = start_end_df.copy()[["label", "det_id"]]
-        overlap_end_df = start_end_df.copy()[["label", "det_id"]]
-
-        start_end_df["start_x"] = start_end_df.apply(lambda row: row[0][0][0],  axis=1)
-        start_end_df["start_y"] = start_end_df.apply(lambda row: row[0][0][1],  axis=1)
-        start_end_df["end_x"]   = start_end_df.apply(lambda row: row[0][-1][0], axis=1)
-        start_end_df["end_y"]   = start_end_df.apply(lambda row: row[0][-1][1], axis=1)
-        if 0 in start_end_df:
-            del start_end_df[0]
-
-        # 2. Get overlaps between start and end, and each region
-        region_polys = {}
-        for route_region in ROUTE_REGIONS.keys():
-            cur_polygon = Polygon(ROUTE_REGIONS[route_region])
-            region_polys[route_region] = cur_polygon
-
-            # Start Geometry
-            start_geometry = [Point(x, y) for x, y in zip(start_end_df["start_x"], start_end_df["start_y"])]
-
-            # Start Overlap
-            start_end_df[f"{route_region}_start_overlap"] = [point.within(cur_polygon) for point in start_geometry]
-            overlap_start_df[route_region]                = start_end_df[f"{route_region}_start_overlap"]
-
-            # End Geometry
-            end_geometry = [Point(x, y) for x, y in zip(start_end_df["end_x"], start_end_df["end_y"])]
-
-            # End Overlap
-            start_end_df[f"{route_region}_end_overlap"] = [point.within(cur_polygon) for point in end_geometry]
-            overlap_end_df[route_region]                = start_end_df[f"{route_region}_end_overlap"]
-
-        #### Determine Start Label
-        def label_overlap(row):
-            for i in range(len(row)):
-                if row[i]:
-                    return overlap_start_df.columns[2:][i]
-            return np.nan
-
-        overlap_start_df['overlap_label'] = overlap_start_df.iloc[:, 2:].apply(label_overlap, axis=1)
-
-        #### Determine End Label
-        def label_overlap(row):
-            for i in range(len(row)):
-                if row[i]:
-                    return overlap_end_df.columns[2:][i]
-            return np.nan
-
-        overlap_end_df['overlap_label'] = overlap_end_df.iloc[:, 2:].apply(label_overlap, axis=1)
-
-        #### Create Final Overlap DataFrame
-        overlap_df = start_end_df.iloc[:, :2]
-        overlap_df["start"] = overlap_start_df["overlap_label"]
-        overlap_df["end"]   = overlap_end_df["overlap_label"]
-
-        ### Finding Times Spent in and Out of Regions
-        #### Organise Route Boundary DataFrame
-        def get_values(group):
-            return group[['timestamp','anchor_x', 'anchor_y']].values.tolist()
-
-        route_boundaries_df = routes_df.groupby(['label', 'det_id']).apply(get_values)
-        route_boundaries_df = pd.DataFrame(route_boundaries_df.reset_index(name='route'))
-
-        # Add region names from overlap_df
-        route_boundaries_df = pd.merge(route_boundaries_df, overlap_df, on=['label', 'det_id'])
-        route_boundaries_df.rename(columns={'start':'start_region', 'end':'end_region'}, inplace=True)
-        entire_routes = route_boundaries_df.copy()
-
-        #### Arrange Start and End Points
-        route_boundaries_df['start_point'] = route_boundaries_df['route'].apply(lambda route: route[0])
-        route_boundaries_df['end_point'] = route_boundaries_df['route'].apply(lambda route: route[-1])
-
-        #### Find Starting Region Boundary
-        def findFirstRegionBoundary(vals):
-            initialRegion = which_region(Point(*vals[0][1:]))
-            if initialRegion is None: return None
-            
-            # Binary search for boundary point
-            pointRange = vals
-            while len(pointRange) > 1:
-                midIndex = round(len(pointRange)/2)
-                midpoint = pointRange[midIndex]
-                regionCheck = which_region(Point(*midpoint[1:]))
-
-                if regionCheck == initialRegion:
-                    pointRange = pointRange[midIndex:] # go right
-                else:
-                    pointRange = pointRange[:midIndex] # go left
-            
-            if len(pointRange) != 0: return pointRange[0]
-
-        def which_region(point):
-            for label, poly in region_polys.items():
-                if point.within(poly):
-                    return label
-
-        route_boundaries_df['start_boundary'] = route_boundaries_df['route'].apply(findFirstRegionBoundary)
-
-        #### Find Ending Region Boundary
-        def findEndRegionBoundary(start_region, end_region, route):
-            if start_region == end_region:
-                return None
-            else:
-                return findFirstRegionBoundary(route[::-1])
-
-        # Reverse the list and find the end region boundary
-        route_boundaries_df['end_boundary'] = route_boundaries_df.apply(
-            lambda row: findEndRegionBoundary(row['start_region'], row['end_region'], row['route']),
-            axis=1
-        )
-
-        #### Organise Dataframe
-        # Reorder columns
-        route_boundaries_df = route_boundaries_df.reindex(columns=['label', 'det_id', 'start_region', 'start_point', 'start_boundary', 'end_boundary', 'end_point', 'end_region'])
-        route_boundaries_df.loc[route_boundaries_df['label'] == 'car']
-
-        # ROUTE BOUNDARIES FINISHED HERE #
-
-        #### Workout Times Spent in Each Region From Timestamps
-        route_times_df = route_boundaries_df.copy()
-
-        def find_time(start_boundary, end_boundary):
-            if start_boundary is None or end_boundary is None: 
-                return None
-            else:
-                return end_boundary[0] - start_boundary[0]
-
-        # Time spent overall in the route
-        route_times_df['overall_time'] = route_times_df.apply(
-            lambda row: row['end_point'][0] - row['start_point'][0], 
-            axis=1
-        )
-
-        # Time spent in first region
-        route_times_df['start_region_time'] = route_times_df.apply(
-            lambda row: find_time(row['start_point'], row['start_boundary']), 
-            axis=1
-        )
-
-        # Time spent in last region
-        route_times_df['end_region_time'] = route_times_df.apply(
-            lambda row: row['start_region_time'] if pd.isna(result := find_time(row['end_boundary'], row['end_point'])) else result,
-            axis=1
-        )
-
-        def out_of_region_time(overall_time, start_region_time, end_region_time):
-            startIsNotNone = not pd.isna(start_region_time)
-            endIsNotNone = not pd.isna(end_region_time)
-
-            # Ensure if there's only one region the no_region_time is None
-            if overall_time == start_region_time: return None
-
-            if startIsNotNone and endIsNotNone and start_region_time != end_region_time:
-                return (overall_time - start_region_time) - end_region_time
-            elif startIsNotNone:
-                return overall_time - start_region_time
-            elif endIsNotNone:
-                return overall_time - end_region_time
-            else:
-                return overall_time
-            
-        # Time spent not in a region
-        route_times_df['no_region_time'] = route_times_df.apply(
-            lambda row: out_of_region_time(row['overall_time'], row['start_region_time'], row['end_region_time']), 
-            axis=1
-        )
-
-        # Reorder columns
-        route_times_df = route_times_df.reindex(columns=['label', 'det_id', 'start_region', 'overall_time', 'start_region_time', 'end_region_time', 'no_region_time', 'end_region'])
-
-        ## Add start and end times of detection for time filtering
-        route_times_df['start_time'] = route_boundaries_df['start_point'].apply(
-            lambda row: row[0],
-        )
-        route_times_df['end_time'] = route_boundaries_df['end_point'].apply(
-            lambda row: row[0],
-        )
-
-        ### Sort DataFrame
-        route_times_df.sort_values(['start_time', 'end_time'], axis=0, inplace=True)
-
-        ### Data filtering
-        route_times_df = route_times_df[route_times_df['label'].isin(CLASSES)]
+        # Start and end region and time of every track, rolled up into time
+        # buckets. Times are relative to the start of the recording.
+        rollup   = get_rollup(stream, content, FPS, timer)
+        start_us = arrow_to_us([TIME_OF_RECORDING])[0]
 
         ### Splitting the detections by timestamp intervals
         if 'end_time' not in content:
-            END_TIME = route_times_df['end_time'].iloc[-1]
+            END_TIME = us_to_arrow(start_us + rollup.last_end_time(CLASSES))
 
         if INTERVAL_SPACING is None:
             INTERVAL_SPACING = END_TIME - TIME_OF_RECORDING
@@ -479,126 +564,36 @@ def routeAnalytics():
             INTERVAL_SPACING = 30 if INTERVAL_SPACING == 0 else INTERVAL_SPACING
 
         timeBoundaries = [i for i in arrow.Arrow.interval('second', START_TIME, END_TIME, INTERVAL_SPACING)]
-        BoundaryEnds = [i[1] for i in timeBoundaries]
-
-        detSplit = [[] for i in range(len(BoundaryEnds))]
-        currentDet = 0
 
         print("INTERVAL_SPACING:", INTERVAL_SPACING)
-        print("route_times_df, timeBoundaries, BoundaryEnds, detSplit:", route_times_df, timeBoundaries, BoundaryEnds, detSplit)
-        if "interval_spacing" in content:
-            for boundaryIndex, timeBoundary in enumerate(BoundaryEnds):
-                nextBound = False
-
-                for detIndex, det in route_times_df.iloc[currentDet:].iterrows():
-                    start = det['start_time']
-                    end = det['end_time']
-                    # working interval code
-                    if start < timeBoundary:
-                        # if end within time interval or at least has more time in interval
-                        if end < timeBoundary or timeBoundary - start > end - timeBoundary:
-                            destInterval = boundaryIndex # Add detection to current interval
-                        else:
-                            destInterval = boundaryIndex + 1 # Add detection to next interval
-                        detSplit[destInterval].append(det)
-                    else:
-                        nextBound = True
-                        break
-
-                    currentDet += 1
-
-                if nextBound:
-                    continue
-        else:
-            for boundaryIndex, timeBoundary in enumerate(timeBoundaries):
-                nextBound = False
-
-                for detIndex, det in route_times_df.iloc[currentDet:].iterrows():
-                    start = det['start_time']
-                    end = det['end_time']
-                    # working all code
-                    if start.is_between(*timeBoundary):
-                        # if end within time interval or at least has more time in interval
-                        if end.is_between(*timeBoundary) or \
-                                timeBoundary[1] - start > end - timeBoundary[1] or \
-                                boundaryIndex + 1 >= len(detSplit): 
-                            destInterval = boundaryIndex # Add detection to current interval
-                        else:
-                            destInterval = boundaryIndex + 1 # Add detection to next interval
-                        detSplit[destInterval].append(det)
-                    else:
-                        nextBound = True
-                        break
-
-                    currentDet += 1
-
-                if nextBound:
-                    continue
-                
-        ### Split Detections into data-structure with interval stamps
 
-        # Separate Detections (dets) by period of time
-        countsAtTimes = [{'periodFrom'  : from_.float_timestamp, 
-                        'periodTo'    : to_.float_timestamp,
-                        'routeCounts' : pd.DataFrame(dets, columns=route_times_df.columns)} \
-                    for (from_, to_), dets in zip(timeBoundaries, detSplit)]
-        # countsAtTimes[0]['routeCounts']
-
-        # Count detection types by their label and sum their counts in 'total'
-        def countByClass(df):
-            counts = {'total':0}
-            for _, row in df.iterrows():
-                label = row['label']
-                if label in counts:
-                    counts[label] += 1
-                else:
-                    counts[label] = 1
-                counts['total'] += 1
-            return counts
-
-        # Separate Further into Directional Combinations of Start region and End region for each interval
-        to_remove = []
-        for index, interval in enumerate(countsAtTimes):
-            routeCounts = interval['routeCounts']
-            
-            # Filter detections by their Start and End regions
-            routeCounts = routeCounts[
-                (routeCounts['start_region'].isin(START_REGIONS)) &
-                (routeCounts['end_region'].isin(END_REGIONS))]
-            
-            # Split detections by start end region combinations
-            detSplit = {}
-            for _, det in routeCounts.iterrows():
-                start, end = det['start_region'], det['end_region']
-                if start == end:
-                    continue # filter out stationary detections
-                elif (start, end) not in detSplit:
-                    detSplit[(start, end)] = [det]
-                else:
-                    detSplit[(start, end)].append(det)
-
-            # Structure the split detections
-            routeCounts = []
-            for key, value in detSplit.items():
-                df = pd.DataFrame(value, columns=route_times_df.columns)
-                routeCounts.append({
-                    'start': key[0], 
-                    'end': key[1], 
-                    'counts': countByClass(df)
-                })
-
-            # If routes empty add list to delete time period
-            if len(routeCounts) == 0:
-                to_remove.append(index)
-
-            interval['routeCounts'] = routeCounts
-
-        # Remove empty routeCounts
-        temp_list = []
-        for i, interval in enumerate(countsAtTimes):
-            if i not in to_remove:
-                temp_list.append(interval)
-        countsAtTimes = temp_list
+        # Tracks are counted from the coarsest rollup whose buckets the
+        # intervals are aligned to, otherwise one by one
+        floors = arrow_to_us([from_ for from_, _ in timeBoundaries])
+        ceils  = arrow_to_us([to_ for _, to_ in timeBoundaries])
+        route_times_df, _ = rollup.route_times(floors - start_us, ceils - start_us, CLASSES)
+
+        # Assign each detection to an interval by searching the epoch
+        # (microsecond) interval boundaries. Detections before the first
+        # interval are only counted when splitting by a given spacing.
+        route_times_df = route_times_df.assign(interval=assign_intervals(
+            start_us + route_times_df['start_time'].to_numpy(),
+            start_us + route_times_df['end_time'].to_numpy(),
+            floors,
+            ceils,
+            include_earlier="interval_spacing" in content))
+        timer.lap("intervals", rows=len(route_times_df))
+
+        ### Split Detections into data-structure with interval stamps
+        # Count detections by their start and end region combinations and
+        # class for every interval in one pass. Intervals without any
+        # routes are left out.
+        intervalCounts = route_counts(route_times_df, START_REGIONS, END_REGIONS, count_col="count")
+        countsAtTimes  = [{'periodFrom'  : timeBoundaries[i][0].float_timestamp,
+                           'periodTo'    : timeBoundaries[i][1].float_timestamp,
+                           'routeCounts' : intervalCounts[i]} \
+                    for i in sorted(intervalCounts)]
+        timer.lap("counts", rows=len(route_times_df))
 
         # Structure the rest of the json message
         final_data = {
@@ -607,14 +602,101 @@ def routeAnalytics():
             "countsAtTimes": countsAtTimes
         }
         # print(json.dumps(final_data, indent=4))
-        return jsonify(final_data)
+        ANALYTICS_CACHE.put(cache_key, (version, final_data))
+        response = json_response(final_data, content.get("precision"))
+        timer.lap("encode")
+        timer.finish()
+        return response
 
     except Exception as e:
+        timer.finish("error")
         import traceback
         traceback.print_exc()
         return jsonify("Error:", str(e)), 400
 
+# Number of raw detections or tracks in a page if `limit` isn't given
+DEFAULT_PAGE_SIZE = 1000
+
+def load_page_tracks(analysis_path, start, end, classes):
+    """Get the track endpoints of a stream in page order, see
+    `trajectory.page_order`, with the number of tracks of each class and the
+    metadata table. Whole tracks are read from the track summaries, tracks
+    within a frame range from the filtered detections."""
+    stream = analysis_path.stem
+    if start is None and end is None:
+        tracks_df, metadata_df = get_tracks(stream, classes)
+    else:
+        data, metadata_df = get_tables(stream, start, end, classes)
+        tracks_df = track_endpoints(add_anchors(data))
+    counts_df = tracks_df.groupby('label')['det_id'].nunique().reset_index(name='count')
+    return page_order(tracks_df), counts_df, metadata_df
+
+# Tracks in page order, keyed by stream, frame range and classes, so each
+# page is found by binary search instead of sorting every track again
+PAGE_CACHE = StreamCache(256 * 1024 * 1024, load_page_tracks)
+
+def analysis_page(content, trk_fmt, raw, timer):
+    """Get a page of the raw detections (if `raw` is set) or of the routes
+    of a video stream, see `analysis`. Pages are ordered by frame and
+    det_id, and are read from the position in the `cursor` of the previous
+    page, so only the rows of the requested page are read."""
+    stream  = content["stream"]
+    start   = content.get("start")
+    end     = content.get("end")
+    classes = content.get("classes")
+    limit   = content.get("limit")
+    limit   = DEFAULT_PAGE_SIZE if limit is None else int(limit)
+    if limit < 1:
+        raise ValueError("limit must be positive")
+    limit   = min(limit, FLAGS.max_page_size)
+    key     = decode_cursor(content["cursor"]) if content.get("cursor") else None
+
+    analysis_path = Path(FLAGS.analysis_dir) / f"{stream}.db"
+    if not analysis_path.exists():
+        raise FileNotFoundError(f"No analysis database for stream {stream}")
+
+    if raw:
+        with DB_POOL.connection(analysis_path) as con:
+            page_df, next_key = read_detection_page(con, start, end, classes, key, limit)
+            metadata_df = read_metadata(con)
+        timer.lap("load", rows=len(page_df))
+        final_data = {
+            "metadata": metadata_df,
+            "raw": page_df,
+        }
+    else:
+        if classes is not None:
+            classes = tuple(sorted(set(classes)))
+        tracks_df, counts_df, metadata_df = PAGE_CACHE.get(stream, analysis_path, start, end, classes)
+        timer.lap("load", rows=len(tracks_df))
+        page_df, next_key = endpoint_page(tracks_df, key, limit)
+        timer.lap("counts", rows=len(page_df))
+
+        if trk_fmt == "first_last":
+            route_dict = endpoint_routes_by_label(page_df)
+        else:
+            tracks = list(zip(page_df["label"], page_df["det_id"]))
+            with DB_POOL.connection(analysis_path) as con:
+                data = read_track_detections(con, tracks, start, end)
+            routes_df  = add_anchors(data[["frame", "label", "det_id", "bbox_x", "bbox_y", "bbox_w", "bbox_h"]])
+            route_dict = routes_by_label(routes_df, trk_fmt)
+        timer.lap("routes", rows=len(page_df))
+
+        final_data = {
+            "metadata": metadata_df,
+            "tracking_format": trk_fmt,
+            "counts": counts_df,
+            "routes": route_dict
+        }
+
+    final_data["next_cursor"] = None if next_key is None else encode_cursor(next_key)
+    response = json_response(final_data, content.get("precision"))
+    timer.lap("encode")
+    return response
+
 @app.route("/api/analysis/", methods=["POST"])
+@profiled
+@conditional
 def analysis():
     """Get count and route analytical information of a video stream.
     
@@ -628,91 +710,222 @@ def analysis():
                   include the first and last anchor points for an object in the
                   route, or it will include the entire route for the requested
                   portion of the video. By default, returns `first_last`.
+        precision - (Optional) Decimal places to round coordinates to
+        limit   - (Optional) Page size. Returns a page of the raw detections
+                  if `raw` is set, otherwise a page of the routes, along with
+                  a `next_cursor` (null on the last page)
+        cursor  - (Optional) `next_cursor` of the previous page
     """
+    timer = StageTimer("analysis")
     try:
         # Get stream ID
         content = request.json
         stream  = content["stream"]
         print("api/analysis->content:", content)
 
-        # Get SQLite detection data
-        analysis_path = Path(FLAGS.analysis_dir) / f"{stream}.db"
-        con = sqlite3.connect(analysis_path)
-        detections_df = pd.read_sql_query("SELECT * FROM detection;", con)
-        metadata_df   = pd.read_sql_query("SELECT * FROM metadata;", con)
-        metadata_df   = metadata_df.iloc[0]
-        if "id" in metadata_df:
-            del metadata_df["id"]
-        con.close()
-
-        # (Optional) Apply start and end frame filters
-        data = detections_df
-        if "start" in content:
-            data = data[data["frame"] >= content["start"]]
-        if "end" in content:
-            data = data[data["frame"] <= content["end"]]
-        if "classes" in content:
-            classes = content["classes"]
-            data    = data[data["label"].isin(classes)]
-        
-        # Get and extract count information for each (label, det_id) tuple
-        counts_df = data.groupby('label')['det_id'].nunique().reset_index(name='count')
-        counts    = json.loads(counts_df.to_json(orient="records"))
-
-        # Get route information for each (label, det_id) tuple
-        routes_df = data[["frame", "label", "det_id", "bbox_x", "bbox_y", "bbox_w", "bbox_h"]].copy()
-        routes_df["anchor_x"] = routes_df.apply(
-            lambda row: row["bbox_x"] + (row["bbox_w"] / 2.0), axis=1)
-        routes_df["anchor_y"] = routes_df.apply(
-            lambda row: row["bbox_y"] + (row["bbox_h"] / 2.0), axis=1)
-
         # Extract first and last or all anchor positions for each (label, det_id) tuple
         trk_fmt = "first_last"
         if "trk_fmt" in content:
             if content["trk_fmt"] == "entire":
                 trk_fmt = "entire"
-        def get_values(group, trk_fmt):
-            vals = group[['frame', 'anchor_x', 'anchor_y']].values.tolist()
-            if trk_fmt == "first_last":
-                vals = [vals[0], vals[-1]]
-            vals = [{"frame:": val[0], "x": val[1], "y": val[2]} for val in vals]
-            return vals
-
-        routes = routes_df.groupby(['label', 'det_id']).apply(
-                    lambda group: get_values(group, trk_fmt))
-
-        # Reset the index of the resulting series to remove the MultiIndex
-        routes = routes.reset_index()
-
-        # Replace the MultiIndex label column names with 'label' and 'det_id'
-        routes.rename(columns={0: 'routes'}, inplace=True)
-        routes.rename(columns={'level_0': 'label', 'level_1': 'det_id'}, inplace=True)
+        raw = content.get("raw") == True
+
+        if content.get("limit") is not None or content.get("cursor") is not None:
+            response = analysis_page(content, trk_fmt, raw, timer)
+            timer.finish()
+            return response
+
+        # Counts and first and last anchor positions of whole tracks can be
+        # read from the track summaries
+        tracks_df = None
+        if content.get("start") is None and content.get("end") is None and \
+           trk_fmt == "first_last" and not raw:
+            tracks_df, metadata_df = get_tracks(stream, content.get("classes"))
+
+        if tracks_df is not None:
+            data = tracks_df
+        else:
+            # Get SQLite detection data, (optionally) filtered by start and
+            # end frame and class labels
+            data, metadata_df = get_tables(
+                stream, content.get("start"), content.get("end"), content.get("classes"))
+        timer.lap("load", rows=len(data))
+        
+        # Get and extract count information for each (label, det_id) tuple
+        counts_df = data.groupby('label')['det_id'].nunique().reset_index(name='count')
+        timer.lap("counts", rows=len(data))
 
         # Create a dictionary with 'label' as the key and 'routes' as the value
-        route_dict = routes.groupby('label')['routes'].apply(list).to_dict()
-
-        # Convert metadata into dict
-        metadata = json.loads(metadata_df.to_json(orient="index"))
+        if tracks_df is not None:
+            route_dict = endpoint_routes_by_label(tracks_df)
+        else:
+            # Get route information for each (label, det_id) tuple
+            routes_df  = add_anchors(data[["frame", "label", "det_id", "bbox_x", "bbox_y", "bbox_w", "bbox_h"]])
+            route_dict = routes_by_label(routes_df, trk_fmt)
+        timer.lap("routes", rows=len(data))
 
         # Separate raw data and analytical data
         final_data = {
-            "metadata": metadata,
+            "metadata": metadata_df,
             "tracking_format": trk_fmt,
-            "counts": counts,
+            "counts": counts_df,
             "routes": route_dict
         }
 
-        if "raw" in content:
-            if content["raw"] == True:
-                final_data["raw"] = json.loads(data.to_json(orient="records"))
+        # Raw detections are streamed in chunks rather than being encoded
+        # all at once, so their encoding isn't timed. Everything else is
+        # encoded first, so errors are still returned as a 400.
+        if raw:
+            chunks = iter_object(
+                final_data, "raw",
+                iter_records(data, precision=content.get("precision")),
+                content.get("precision"))
+            timer.finish()
+            return Response(chunks, mimetype="application/json")
+
+        response = json_response(final_data, content.get("precision"))
+        timer.lap("encode")
+        timer.finish()
+        return response
+    except Exception as e:
+        timer.finish("error")
+        return jsonify("Error:", str(e)), 400
+
+def stream_counts(stream, start=None, end=None, classes=None):
+    """Count the tracks of each class label of a stream, from the track
+    summaries unless filtered by start and end frame.
+
+    returns:
+        (counts_df, metadata_df) - Counts in the `/api/analysis/` format and
+                                   the stream's metadata"""
+    if start is None and end is None:
+        data, metadata_df = get_tracks(stream, classes)
+    else:
+        data, metadata_df = get_tables(stream, start, end, classes)
+    counts_df = data.groupby('label')['det_id'].nunique().reset_index(name='count')
+    return counts_df, metadata_df
+
+@app.route("/api/analysis/batch", methods=["POST"])
+@profiled
+@conditional
+def analysis_batch():
+    """Get the counts of several video streams at once, e.g. every camera of
+    a corridor. Streams are processed in parallel by up to
+    `--batch_workers` threads.
 
-        return jsonify(final_data)
+    args:
+        streams - List of stream IDs to get data for.
+        start   - (Optional) Start frame, for every stream
+        end     - (Optional) End frame, for every stream
+        classes - (Optional) List of COCO class labels to filter detections by
+    returns:
+        `streams` with the `metadata` and `counts` of each stream (or its
+        `error`), and `counts` summed over every stream
+    """
+    timer = StageTimer("analysisBatch")
+    try:
+        content = request.json
+        streams = content["streams"]
+        print("api/analysis/batch->content:", content)
+        if not isinstance(streams, list) or len(streams) == 0:
+            timer.finish("error")
+            return jsonify("Error: Streams must be a non-empty list"), 400
+        streams = list(dict.fromkeys(streams))
+
+        workers = max(1, min(len(streams), FLAGS.batch_workers))
+        with concurrent.futures.ThreadPoolExecutor(workers) as executor:
+            futures = {
+                stream: executor.submit(
+                    stream_counts, stream,
+                    content.get("start"), content.get("end"), content.get("classes"))
+                for stream in streams}
+
+        # A stream which can't be read doesn't fail the whole batch
+        stream_data, all_counts = {}, []
+        for stream, future in futures.items():
+            try:
+                counts_df, metadata_df = future.result()
+            except Exception as e:
+                stream_data[stream] = {"error": str(e)}
+                continue
+            stream_data[stream] = {"metadata": metadata_df, "counts": counts_df}
+            all_counts.append(counts_df)
+        timer.lap("streams", rows=len(streams))
+
+        if all_counts:
+            counts_df = pd.concat(all_counts).groupby('label')['count'].sum().reset_index()
+        else:
+            counts_df = pd.DataFrame({"label": [], "count": []})
+        timer.lap("counts", rows=len(all_counts))
+
+        response = json_response({"streams": stream_data, "counts": counts_df})
+        timer.lap("encode")
+        timer.finish()
+        return response
     except Exception as e:
+        timer.finish("error")
         return jsonify("Error:", str(e)), 400
 
+@app.route("/api/export/", methods=["POST"])
+@conditional(vary=["Accept"])
+def export():
+    """Export the detection table of a video stream in a binary columnar
+    format, for bulk consumers of raw detections.
+
+    args:
+        stream  - Stream ID to get data for.
+        start   - (Optional) Start frame
+        end     - (Optional) End frame
+        classes - (Optional) List of COCO class labels to filter detections by
+        format  - (Optional) One of `arrow` (Arrow IPC file), `parquet` or
+                  `npz`. Otherwise negotiated from the Accept header,
+                  defaulting to `arrow` if pyarrow is installed, else `npz`.
+    """
+    try:
+        content = request.json
+        stream  = content["stream"]
+        print("api/export->content:", content)
+
+        formats = available_formats()
+        fmt     = content.get("format")
+        if fmt is None:
+            mimetype = request.accept_mimetypes.best_match(
+                [EXPORT_FORMATS[fmt][0] for fmt in formats])
+            fmt = format_for_mimetype(mimetype) or formats[0]
+        if fmt not in formats:
+            return jsonify(f"Error: Export format must be one of {formats}"), 400
+
+        data, _ = get_tables(
+            stream, content.get("start"), content.get("end"), content.get("classes"))
+        mimetype, extension = EXPORT_FORMATS[fmt]
+        return Response(
+            export_table(data, fmt),
+            mimetype=mimetype,
+            headers={"Content-Disposition": f'attachment; filename="{stream}.{extension}"'})
+    except Exception as e:
+        return jsonify("Error:", str(e)), 400
+
+# Stream analyses run in the background, see `/api/jobs/<job_id>`
+ANALYSIS_JOBS = JobQueue(1)
+
+def finish_analysis(stream, analysis_path):
+    """Index a finished analysis database for frame range and class
+    queries, summarise its tracks and write its columnar sidecar. A
+    re-analysis may have rewritten the database so nothing cached for the
+    stream is kept."""
+    STREAM_CACHE.invalidate(stream)
+    TRACK_CACHE.invalidate(stream)
+    ROLLUP_CACHE.invalidate(stream)
+    PAGE_CACHE.invalidate(stream)
+    if analysis_path.exists():
+        ensure_indexes(analysis_path)
+        build_tracks(analysis_path)
+        write_sidecar(analysis_path)
+
 @app.route("/api/init", methods=["POST"])
 def init():
-    """Initiate an analysis of a video stream.
+    """Initiate an analysis of a video stream. The analysis is queued and
+    runs in the background, poll `/api/jobs/<job_id>` for its progress.
     
     args:
         stream - Absolute video stream path
@@ -726,21 +939,61 @@ def init():
         args = list(filter(None, OFFLINE_ANALYSIS(stream, analysis_path, half).split(" ")))
 
         logging.info(args)
-        
-        # NOTE: Uncomment stdout and stderr for async operation, it's sync by default
-        subprocess.run(
+
+        job = ANALYSIS_JOBS.submit(
             args,
-            #stdout=subprocess.PIPE,
-            #stderr=subprocess.PIPE,
-            cwd=os.getcwd())
-        
-        return jsonify("Video stream analysis successfully started")
+            cwd=os.getcwd(),
+            on_success=lambda job: finish_analysis(analysis_fname, analysis_path),
+            info={"stream": analysis_fname})
+        return jsonify(job.to_dict()), 202
 
     except Exception as e:
         return jsonify("Error:", str(e)), 400
 
+@app.route("/api/jobs/", methods=["GET"])
+def jobs():
+    """Get the state of every known stream analysis job."""
+    return jsonify([job.to_dict() for job in ANALYSIS_JOBS.jobs()])
+
+@app.route("/api/jobs/<job_id>", methods=["GET"])
+def job_status(job_id):
+    """Get the state, progress (0 to 1), wall time and exit code of a
+    stream analysis job."""
+    job = ANALYSIS_JOBS.get(job_id)
+    if job is None:
+        return jsonify(f"Error: Unknown job {job_id}"), 404
+    return jsonify(job.to_dict())
+
+def preload():
+    """Warm the caches before serving. Every analysis database is indexed
+    and its track summaries loaded, along with the detection tables of the
+    `--preload` streams. With multiple worker processes this runs once,
+    before the workers are forked, so they share the loaded tables."""
+    analysis_paths = sorted(Path(FLAGS.analysis_dir).glob("*.db"))
+    for analysis_path in analysis_paths:
+        try:
+            get_tracks(analysis_path.stem)
+        except Exception as e:
+            logging.warning("Could not preload tracks of %s: %s", analysis_path, e)
+    for stream in FLAGS.preload:
+        try:
+            get_tables(stream)
+        except Exception as e:
+            logging.warning("Could not preload stream %s: %s", stream, e)
+    logging.info("Preloaded %d track summaries and %d streams",
+                 len(analysis_paths), len(FLAGS.preload))
+
+    # Worker processes open their own database connections
+    DB_POOL.close()
+
 def main(unused_argv):
-    app.run(host=FLAGS.host, port=FLAGS.port)
+    STREAM_CACHE.lru.max_bytes = FLAGS.cache_mb * 1024 * 1024
+    ANALYSIS_JOBS.max_workers  = FLAGS.analysis_workers
+    DB_POOL.max_connections    = FLAGS.max_db_connections
+    if FLAGS.workers > 1:
+        logging.warning("Analysis jobs are only known to the worker process "
+                        "which started them, see `/api/jobs/<job_id>`")
+    serve(app, FLAGS.host, FLAGS.port, FLAGS.workers, FLAGS.threads, preload)
 
 def entry_point():
     absl_app.run(main)
@@ -0,0 +1,125 @@
+# MIT License
+#
+# Copyright (c) 2023 MEng-Team-Project
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+"""Helpers for aggregating per-track route information into the time
+interval counts returned by the route analytics endpoint."""
+
+import arrow
+import numpy as np
+
+def arrow_to_us(times):
+    """Convert Arrow times into an int64 array of epoch microseconds."""
+    return np.array(
+        [t.int_timestamp * 1000000 + t.microsecond for t in times],
+        dtype=np.int64)
+
+def us_to_arrow(us):
+    """Convert epoch microseconds back into a UTC Arrow time."""
+    seconds, microseconds = divmod(int(us), 1000000)
+    return arrow.get(seconds).shift(microseconds=microseconds)
+
+def frames_to_us(frames, start_us, fps):
+    """Epoch microsecond time of each frame of a recording, rounded to the
+    nearest microsecond in the same way as shifting an Arrow time.
+
+    args:
+        frames   - Frame numbers
+        start_us - Epoch microsecond time of the first frame
+        fps      - Frames per second of the recording
+    returns:
+        int64 array of epoch microseconds"""
+    offsets = (1000000 / fps) * np.asarray(frames, dtype=np.float64)
+    return start_us + np.rint(offsets).astype(np.int64)
+
+def assign_intervals(start_times, end_times, floors, ceils, include_earlier=False):
+    """Find the time interval each track is counted in. A track is counted
+    in the interval its start time falls in, unless it spends more time
+    after the end of that interval than in it, in which case it is counted
+    in the next interval (or the last one if there is no next interval).
+
+    args:
+        start_times     - Start time of each track
+        end_times       - End time of each track
+        floors          - Sorted, inclusive start time of each interval
+        ceils           - Sorted, inclusive end time of each interval
+        include_earlier - (Optional) Count tracks starting before the first
+                          interval as if they started in the first interval
+    returns:
+        Interval index of each track, -1 for tracks outside of every interval"""
+    start_times = np.asarray(start_times)
+    end_times   = np.asarray(end_times)
+    floors      = np.asarray(floors)
+    ceils       = np.asarray(ceils)
+    n = len(ceils)
+    if n == 0:
+        return np.full(len(start_times), -1, dtype=np.int64)
+
+    idx   = np.searchsorted(ceils, start_times, side="left")
+    valid = idx < n
+    idx   = np.minimum(idx, n - 1)
+    if not include_earlier:
+        valid &= start_times >= floors[idx]
+
+    ceil = ceils[idx]
+    move_next = (end_times > ceil) & (ceil - start_times <= end_times - ceil)
+    idx = np.minimum(idx + move_next, n - 1)
+    return np.where(valid, idx, -1).astype(np.int64)
+
+def route_counts(route_times_df, start_regions, end_regions, count_col=None):
+    """Count tracks in each interval by their start and end region, and by
+    class. Stationary tracks (starting and ending in the same region) and
+    tracks outside of every interval are not counted.
+
+    args:
+        route_times_df - Tracks with `interval`, `start_region`,
+                         `end_region` and `label` columns
+        start_regions  - Start regions to count
+        end_regions    - End regions to count
+        count_col      - (Optional) Column with the number of tracks of each
+                         row, e.g. of a `rollup.RouteRollup`. By default,
+                         each row is one track
+    returns:
+        Dict from interval index to a list of route counts, in order of
+        each route's first track, e.g.
+        `{0: [{'start': 'a', 'end': 'b', 'counts': {'total': 3, 'car': 3}}]}`"""
+    df = route_times_df[
+        (route_times_df['interval'] >= 0) &
+        (route_times_df['start_region'].isin(start_regions)) &
+        (route_times_df['end_region'].isin(end_regions)) &
+        (route_times_df['start_region'] != route_times_df['end_region'])]
+
+    # Groups are kept in order of first appearance, so routes and classes
+    # are listed in the order their first track appears
+    groups = df.groupby(
+        ['interval', 'start_region', 'end_region', 'label'], sort=False)
+    sizes  = groups.size() if count_col is None else groups[count_col].sum()
+
+    intervals = {}
+    for (interval, start, end, label), size in sizes.items():
+        routes = intervals.setdefault(int(interval), {})
+        if (start, end) not in routes:
+            routes[(start, end)] = {'start': start, 'end': end,
+                                    'counts': {'total': 0}}
+        counts = routes[(start, end)]['counts']
+        counts[label]    = int(size)
+        counts['total'] += int(size)
+    return {interval: list(routes.values())
+            for interval, routes in intervals.items()}
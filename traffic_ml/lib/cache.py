@@ -0,0 +1,247 @@
+# MIT License
+#
+# Copyright (c) 2023 MEng-Team-Project
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+"""In-memory caches shared across requests of the microservice."""
+
+import hashlib
+import json
+import os
+import sys
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+
+def sizeof(value):
+    """Approximate number of bytes held by a cached value. DataFrames and
+    Series are measured deeply so object (string) columns are included.
+    Other objects can report their size with an `nbytes` attribute."""
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        usage = value.memory_usage(deep=True)
+        return int(usage.sum()) if isinstance(usage, pd.Series) else int(usage)
+    if isinstance(value, np.ndarray) or hasattr(value, "nbytes"):
+        return int(value.nbytes)
+    if isinstance(value, (tuple, list)):
+        return sys.getsizeof(value) + sum(sizeof(v) for v in value)
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + \
+            sum(sizeof(k) + sizeof(v) for k, v in value.items())
+    return sys.getsizeof(value)
+
+def file_version(path):
+    """Version of a file on disk as an `(mtime_ns, size)` tuple. Used to
+    detect when an analysis database has been written to since it was
+    cached. Returns None if the file does not exist."""
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+def content_hash(content):
+    """Canonical hash of a JSON request body. Top level fields are sorted,
+    but the order of nested values is kept as it can change the result,
+    e.g. the order of route regions."""
+    canonical = json.dumps(
+        [[key, content[key]] for key in sorted(content)],
+        separators=(",", ":"))
+    return hashlib.sha1(canonical.encode("utf-8")).hexdigest()
+
+
+class LRUCache(object):
+    """Thread-safe least-recently-used cache bounded by the total number of
+    bytes held, rather than by the number of entries.
+
+    args:
+        max_bytes - Upper bound for the summed size of all entries
+        sizeof    - (Optional) Function returning the size of a value"""
+
+    def __init__(self, max_bytes, sizeof=sizeof):
+        self.max_bytes = max_bytes
+        self.sizeof    = sizeof
+        self._entries  = OrderedDict() # key -> (value, nbytes)
+        self._bytes    = 0
+        self._lock     = threading.Lock()
+        self.hits      = 0
+        self.misses    = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def get(self, key, default=None, valid=None):
+        """Look up a value. If `valid` is given, it is called with the cached
+        value and a falsy result drops the entry and counts as a miss."""
+        with self._lock:
+            if key in self._entries and valid is not None and \
+               not valid(self._entries[key][0]):
+                self._remove(key)
+            if key not in self._entries:
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return self._entries[key][0]
+
+    def peek(self, key, valid=None, default=None):
+        """Look up a value without counting a miss or dropping it if it is
+        out of date. If `valid` is given, values for which it returns a
+        falsy result are not returned. Only hits are counted."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or (valid is not None and not valid(entry[0])):
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value, nbytes=None):
+        """Insert a value, evicting the least recently used entries until
+        the cache fits within `max_bytes`. Values larger than the whole
+        cache are not stored."""
+        if nbytes is None:
+            nbytes = self.sizeof(value)
+        with self._lock:
+            self._remove(key)
+            if nbytes > self.max_bytes:
+                return False
+            self._entries[key] = (value, nbytes)
+            self._bytes += nbytes
+            while self._bytes > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._bytes    -= evicted
+                self.evictions += 1
+            return True
+
+    def pop(self, key):
+        with self._lock:
+            return self._remove(key)
+
+    def remove_where(self, predicate):
+        """Remove every entry whose key `predicate` returns true for.
+        Returns the number of entries removed."""
+        with self._lock:
+            keys = [key for key in self._entries if predicate(key)]
+            for key in keys:
+                self._remove(key)
+            return len(keys)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries":   len(self._entries),
+                "bytes":     self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits":      self.hits,
+                "misses":    self.misses,
+                "hit_rate":  self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions
+            }
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return None
+        self._bytes -= entry[1]
+        return entry[0]
+
+
+class StreamCache(object):
+    """Process-wide cache of tables loaded from per-stream analysis
+    databases. Entries are keyed by stream ID plus any query arguments
+    passed to the loader, and remember the version of the `.db` file they
+    were loaded from, so they are reloaded as soon as the file's mtime or
+    size changes. If an `extender` is given, out of date entries are first
+    passed to it so tables of a growing database can be updated with only
+    the rows written since they were loaded.
+
+    args:
+        max_bytes - Upper bound for the memory used by cached tables
+        loader    - Function `loader(path, *query)` which reads the tables to
+                    cache. `query` must be hashable.
+        extender  - (Optional) Function `extender(path, value, *query)` which
+                    updates an out of date cached value, or returns None if
+                    it must be reloaded instead"""
+
+    def __init__(self, max_bytes, loader, extender=None):
+        self.loader     = loader
+        self.extender   = extender
+        self.lru        = LRUCache(max_bytes)
+        self.extensions = 0
+
+    def get(self, stream, path, *query):
+        version = file_version(path)
+        if version is None:
+            self.invalidate(stream)
+            raise FileNotFoundError(f"No analysis database for stream: {stream}")
+
+        # Entries loaded from an older version of the database are stale
+        stale = []
+        def valid(entry):
+            if entry[0] == version:
+                return True
+            stale.append(entry[1])
+            return False
+
+        key   = (stream,) + query
+        entry = self.lru.get(key, valid=valid)
+        if entry is not None:
+            return entry[1]
+
+        value = None
+        if stale and self.extender is not None:
+            value = self.extender(path, stale[0], *query)
+            if value is not None:
+                self.extensions += 1
+        if value is None:
+            value = self.loader(path, *query)
+        self.lru.put(key, (version, value), self.lru.sizeof(value))
+        return value
+
+    def peek(self, stream, path, *query):
+        """Get an up to date cached value without loading it on a miss.
+        Returns None if not cached. Only hits are counted, as the caller is
+        expected to fall back to loading a different query."""
+        version = file_version(path)
+        entry   = self.lru.peek((stream,) + query, valid=lambda entry: entry[0] == version)
+        return None if entry is None else entry[1]
+
+    def invalidate(self, stream=None):
+        if stream is None:
+            self.lru.clear()
+            return
+        self.lru.remove_where(lambda key: key[0] == stream)
+
+    def stats(self):
+        stats = self.lru.stats()
+        stats["extensions"] = self.extensions
+        return stats
@@ -0,0 +1,449 @@
+# MIT License
+#
+# Copyright (c) 2023 MEng-Team-Project
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+"""Helpers for reading the SQLite analysis databases written by the tracker."""
+
+import collections
+import contextlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+import pandas as pd
+
+# Indexes used by frame range and class filtered queries, and by pages of
+# detections (ordered by frame and det_id) and tracks
+DETECTION_INDEXES = {
+    "detection_frame_idx":       "detection(frame)",
+    "detection_frame_det_idx":   "detection(frame, det_id)",
+    "detection_label_track_idx": "detection(label, det_id, frame)"
+}
+
+# Per-track summary of the detection table, see `build_tracks`. The
+# summary records the last detection rowid it covers so detections written
+# after it was built can be added on top of it.
+TRACKS_COLUMNS = [
+    "label", "det_id", "start_frame", "start_x", "start_y",
+    "end_frame", "end_x", "end_y", "n_points"]
+# IDs and frames are untyped to keep the types written by the tracker.
+TRACKS_SCHEMA = """CREATE TABLE tracks (
+    label       TEXT,
+    det_id,
+    start_frame,
+    start_x     REAL,
+    start_y     REAL,
+    end_frame,
+    end_x       REAL,
+    end_y       REAL,
+    n_points    INTEGER,
+    PRIMARY KEY (label, det_id)
+);"""
+TRACKS_INFO_SCHEMA = "CREATE TABLE tracks_info (detection_rowid INTEGER);"
+
+# Applied to every pooled read-only connection: a 256MB memory map and 64MB
+# page cache (negative sizes are in KiB), and temporary sort B-trees kept in
+# memory
+READ_PRAGMAS = {
+    "query_only": "ON",
+    "mmap_size":  256 * 1024 * 1024,
+    "cache_size": -64 * 1024,
+    "temp_store": "MEMORY"
+}
+
+def ensure_indexes(analysis_path):
+    """Create the detection table indexes of an analysis database. This
+    should be run once the tracker has finished writing detections, as it
+    holds the write lock while the indexes are built. Returns False if the
+    indexes could not be created, e.g. because the database is read-only."""
+    try:
+        con = sqlite3.connect(analysis_path, timeout=1.0)
+        try:
+            for name, target in DETECTION_INDEXES.items():
+                con.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {target};")
+            con.commit()
+        finally:
+            con.close()
+    except sqlite3.Error as e:
+        logging.warning("Could not index %s: %s", analysis_path, e)
+        return False
+    return True
+
+def connect_read_only(analysis_path, pragmas=READ_PRAGMAS):
+    """Open a read-only connection to an analysis database, which can be
+    used from any (one at a time) thread. Unlike `sqlite3.connect`, this
+    fails rather than creating the database if it doesn't exist."""
+    uri = f"{Path(analysis_path).resolve().as_uri()}?mode=ro"
+    con = sqlite3.connect(uri, uri=True, check_same_thread=False)
+    for name, value in pragmas.items():
+        con.execute(f"PRAGMA {name} = {value};")
+    return con
+
+class ConnectionPool(object):
+    """Bounded pool of read-only connections to analysis databases, so
+    connections (and their page caches) are reused between requests.
+
+    Connections are pooled by database file, so a database which has been
+    replaced on disk gets new connections. At most `max_connections` are
+    open at once across every database: idle connections of the least
+    recently used databases are closed to make room, and if every
+    connection is in use, callers wait up to `timeout` seconds for one.
+
+    Usage:
+        with pool.connection(analysis_path) as con:
+            read_detections(con)
+    """
+
+    def __init__(self, max_connections=64, max_idle_per_database=4, timeout=30.0,
+                 pragmas=READ_PRAGMAS):
+        self.max_connections       = max_connections
+        self.max_idle_per_database = max_idle_per_database
+        self.timeout               = timeout
+        self.pragmas               = pragmas
+        self._idle      = collections.OrderedDict() # Database -> idle connections, LRU first
+        self._n_open    = 0
+        self._hits      = 0
+        self._misses    = 0
+        self._cond      = threading.Condition()
+        self._pid       = os.getpid()
+        self._abandoned = []
+
+    @staticmethod
+    def _database_key(analysis_path):
+        # Raises FileNotFoundError if the database doesn't exist
+        stat = os.stat(analysis_path)
+        return str(analysis_path), stat.st_dev, stat.st_ino
+
+    def _check_fork(self):
+        # SQLite connections must not be used across fork(), e.g. by
+        # preloaded gunicorn workers, so a forked process starts afresh.
+        # Inherited connections are kept referenced rather than closed.
+        if os.getpid() != self._pid:
+            self._abandoned.extend(self._idle.values())
+            self._idle   = collections.OrderedDict()
+            self._n_open = 0
+            self._pid    = os.getpid()
+
+    def _acquire(self, analysis_path):
+        key      = self._database_key(analysis_path)
+        deadline = time.monotonic() + self.timeout
+        closing  = []
+        with self._cond:
+            self._check_fork()
+            # Close connections to earlier versions of the database
+            for stale in [other for other in self._idle
+                          if other[0] == key[0] and other != key]:
+                closing += self._idle.pop(stale)
+            self._n_open -= len(closing)
+
+            con = None
+            while con is None:
+                idle = self._idle.get(key)
+                if idle:
+                    con = idle.pop()
+                    if not idle:
+                        del self._idle[key]
+                    self._hits += 1
+                    break
+                if self._n_open < self.max_connections:
+                    self._n_open += 1
+                    self._misses += 1
+                    break
+                if self._idle:
+                    # Make room by closing an idle connection of the least
+                    # recently used database
+                    lru_key, lru_idle = next(iter(self._idle.items()))
+                    closing.append(lru_idle.pop())
+                    if not lru_idle:
+                        del self._idle[lru_key]
+                    self._n_open -= 1
+                    continue
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise sqlite3.OperationalError(
+                        f"Timed out waiting for one of {self.max_connections} database connections")
+                self._cond.wait(remaining)
+
+        for stale in closing:
+            stale.close()
+        if con is None:
+            try:
+                con = connect_read_only(analysis_path, self.pragmas)
+            except Exception:
+                with self._cond:
+                    self._n_open -= 1
+                    self._cond.notify()
+                raise
+        return key, con
+
+    def _release(self, key, con):
+        if con.in_transaction:
+            con.rollback()
+        with self._cond:
+            if os.getpid() != self._pid:
+                return
+            idle = self._idle.setdefault(key, [])
+            self._idle.move_to_end(key)
+            if len(idle) < self.max_idle_per_database:
+                idle.append(con)
+                con = None
+            else:
+                self._n_open -= 1
+            self._cond.notify()
+        if con is not None:
+            con.close()
+
+    @contextlib.contextmanager
+    def connection(self, analysis_path):
+        """Borrow a read-only connection to an analysis database."""
+        key, con = self._acquire(analysis_path)
+        try:
+            yield con
+        finally:
+            self._release(key, con)
+
+    def close(self):
+        """Close every idle connection."""
+        with self._cond:
+            self._check_fork()
+            closing = [con for idle in self._idle.values() for con in idle]
+            self._idle.clear()
+            self._n_open -= len(closing)
+        for con in closing:
+            con.close()
+
+    def stats(self):
+        with self._cond:
+            lookups = self._hits + self._misses
+            return {
+                "open":            self._n_open,
+                "idle":            sum(len(idle) for idle in self._idle.values()),
+                "databases":       len(self._idle),
+                "hits":            self._hits,
+                "misses":          self._misses,
+                "hit_rate":        self._hits / lookups if lookups else 0.0,
+                "max_connections": self.max_connections
+            }
+
+def detection_filter(start=None, end=None, classes=None, after=None, until=None):
+    """Build a parameterised WHERE clause for the optional frame range and
+    class label filters of the detection table.
+
+    args:
+        start   - (Optional) Start frame (inclusive)
+        end     - (Optional) End frame (inclusive)
+        classes - (Optional) List of COCO class labels to keep
+        after   - (Optional) Only keep rows written after this rowid
+        until   - (Optional) Only keep rows up to and including this rowid
+    returns:
+        (where, params) - SQL clause (empty if unfiltered) and its parameters"""
+    clauses, params = [], []
+    if start is not None and end is not None:
+        clauses.append("frame BETWEEN ? AND ?")
+        params += [start, end]
+    elif start is not None:
+        clauses.append("frame >= ?")
+        params.append(start)
+    elif end is not None:
+        clauses.append("frame <= ?")
+        params.append(end)
+    if classes is not None:
+        classes = list(classes)
+        clauses.append(f"label IN ({', '.join('?' * len(classes))})")
+        params += classes
+    if after is not None:
+        clauses.append("rowid > ?")
+        params.append(after)
+    if until is not None:
+        clauses.append("rowid <= ?")
+        params.append(until)
+    where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+    return where, params
+
+def read_detections(con, start=None, end=None, classes=None, after=None, until=None):
+    """Read the (optionally filtered) detection table. Rows are returned in
+    insertion order, the same order as an unfiltered `SELECT *`."""
+    where, params = detection_filter(start, end, classes, after, until)
+    return pd.read_sql_query(
+        f"SELECT * FROM detection{where} ORDER BY rowid;", con, params=params)
+
+def read_detection_page(con, start=None, end=None, classes=None, key=None, limit=1000):
+    """Read a page of the (optionally filtered) detection table, ordered by
+    frame and det_id, using the `(frame, det_id, rowid)` key of the last
+    row of the previous page rather than an offset.
+
+    args:
+        key   - (Optional) Key of the last row of the previous page
+        limit - Maximum number of rows in the page
+    returns:
+        (page_df, next_key) - Page of detections and the key of its last
+                              row, or None if this is the last page"""
+    where, params = detection_filter(start, end, classes)
+    if key is not None:
+        where   = f"{where} AND" if where else " WHERE"
+        where  += " (frame, det_id, rowid) > (?, ?, ?)"
+        params += list(key)
+    page_df = pd.read_sql_query(
+        f"SELECT rowid AS _rowid, * FROM detection{where} "
+        "ORDER BY frame, det_id, rowid LIMIT ?;", con, params=params + [limit + 1])
+
+    # One extra row is read to find out if there is another page
+    next_key = None
+    if len(page_df) > limit:
+        page_df  = page_df.iloc[:limit]
+        next_key = [page_df[col].iloc[-1:].tolist()[0] for col in ("frame", "det_id", "_rowid")]
+    return page_df.drop(columns="_rowid"), next_key
+
+def read_track_detections(con, tracks, start=None, end=None):
+    """Read the detections of the given tracks, in insertion order.
+
+    args:
+        tracks - List of (label, det_id) tuples
+        start  - (Optional) Start frame (inclusive)
+        end    - (Optional) End frame (inclusive)"""
+    if len(tracks) == 0:
+        return read_detections(con, start, end, until=0)
+    # Joined rather than filtered with `IN (VALUES ...)`, which SQLite
+    # can't look up in the (label, det_id) index
+    where, params = detection_filter(start, end)
+    params = [value for track in tracks for value in track] + params
+    return pd.read_sql_query(f"""
+        SELECT detection.* FROM (VALUES {', '.join(['(?, ?)'] * len(tracks))}) AS t
+        JOIN detection ON detection.label = t.column1 AND detection.det_id = t.column2
+        {where} ORDER BY detection.rowid;""", con, params=params)
+
+def filter_detections(detections_df, start=None, end=None, classes=None):
+    """In-memory equivalent of `read_detections` for an already loaded
+    detection table."""
+    data = detections_df
+    if start is not None:
+        data = data[data["frame"] >= start]
+    if end is not None:
+        data = data[data["frame"] <= end]
+    if classes is not None:
+        data = data[data["label"].isin(classes)]
+    return data
+
+def read_metadata(con):
+    """Read the metadata of an analysis database as a Series, without its
+    row ID."""
+    metadata_df = pd.read_sql_query("SELECT * FROM metadata;", con)
+    metadata_df = metadata_df.iloc[0].copy()
+    if "id" in metadata_df:
+        del metadata_df["id"]
+    return metadata_df
+
+def detection_watermark(con):
+    """Position of the last detection written, used to read only the
+    detections written since. Returns a `(rowid, frame, label, det_id)`
+    tuple, or None if there are no detections."""
+    return con.execute(
+        "SELECT rowid, frame, label, det_id FROM detection "
+        "ORDER BY rowid DESC LIMIT 1;").fetchone()
+
+def appended_since(con, watermark):
+    """Whether detections have only been appended since `watermark` was
+    taken, i.e. the detection it points to is still in place. Otherwise
+    the database has been rewritten and must be read again in full."""
+    if watermark is None:
+        return True
+    row = con.execute(
+        "SELECT rowid, frame, label, det_id FROM detection WHERE rowid = ?;",
+        (watermark[0],)).fetchone()
+    return row == tuple(watermark)
+
+def watermark_rowid(watermark):
+    """Rowid of a `detection_watermark`, 0 if there were no detections."""
+    return 0 if watermark is None else watermark[0]
+
+def summarise_tracks(con, after=None, until=None):
+    """Summarise every track of the detection table into its first and last
+    frame and anchor point and its number of detections. Returns a
+    DataFrame with the `TRACKS_COLUMNS`, sorted by track, equal to
+    `trajectory.track_endpoints` of the detections. `after` and `until`
+    optionally limit the summary to a rowid range.
+
+    The first and last detection of each track are found from the
+    (label, det_id) index, so only two detections per track are read."""
+    where, params = detection_filter(after=after, until=until)
+    tracked = "label IS NOT NULL AND det_id IS NOT NULL"
+    where   = f"{where} AND {tracked}" if where else f" WHERE {tracked}"
+    return pd.read_sql_query(f"""
+        SELECT t.label, t.det_id,
+               s.frame AS start_frame,
+               s.bbox_x + s.bbox_w / 2.0 AS start_x,
+               s.bbox_y + s.bbox_h / 2.0 AS start_y,
+               e.frame AS end_frame,
+               e.bbox_x + e.bbox_w / 2.0 AS end_x,
+               e.bbox_y + e.bbox_h / 2.0 AS end_y,
+               t.n_points
+        FROM (SELECT label, det_id, min(rowid) AS first_row,
+                     max(rowid) AS last_row, count(*) AS n_points
+              FROM detection{where}
+              GROUP BY label, det_id) AS t
+        JOIN detection AS s ON s.rowid = t.first_row
+        JOIN detection AS e ON e.rowid = t.last_row
+        ORDER BY t.label, t.det_id;""", con, params=params)
+
+def build_tracks(analysis_path):
+    """(Re)build the `tracks` summary table of an analysis database. This
+    should be run once the tracker has finished writing detections.
+    Returns the number of tracks, or None if the database could not be
+    written to."""
+    try:
+        con = sqlite3.connect(analysis_path, timeout=1.0)
+        try:
+            last_rowid = watermark_rowid(detection_watermark(con))
+            tracks_df  = summarise_tracks(con, until=last_rowid)
+            with con:
+                con.execute("DROP TABLE IF EXISTS tracks;")
+                con.execute("DROP TABLE IF EXISTS tracks_info;")
+                con.execute(TRACKS_SCHEMA)
+                con.execute(TRACKS_INFO_SCHEMA)
+                con.executemany(
+                    f"INSERT INTO tracks VALUES ({', '.join('?' * len(TRACKS_COLUMNS))});",
+                    tracks_df.astype(object).itertuples(index=False, name=None))
+                con.execute("INSERT INTO tracks_info VALUES (?);", (last_rowid,))
+        finally:
+            con.close()
+    except sqlite3.Error as e:
+        logging.warning("Could not build tracks of %s: %s", analysis_path, e)
+        return None
+    return len(tracks_df)
+
+def read_tracks(con):
+    """Read the `tracks` summary table, in the same order as
+    `summarise_tracks`.
+
+    returns:
+        (tracks_df, rowid) - Track summary and the last detection rowid it
+                             covers, or None if the table has not been built"""
+    try:
+        info = con.execute("SELECT detection_rowid FROM tracks_info;").fetchone()
+    except sqlite3.OperationalError:
+        return None
+    if info is None:
+        return None
+    tracks_df = pd.read_sql_query(
+        f"SELECT {', '.join(TRACKS_COLUMNS)} FROM tracks ORDER BY label, det_id;", con)
+    return tracks_df, info[0]
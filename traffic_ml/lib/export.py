@@ -0,0 +1,90 @@
+# MIT License
+#
+# Copyright (c) 2023 MEng-Team-Project
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+"""Binary columnar encodings of detection tables for bulk export. Arrow IPC
+and Parquet require pyarrow, compressed NumPy archives (NPZ) are always
+available."""
+
+import io
+
+import numpy as np
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+# Format name -> (MIME type, file extension)
+EXPORT_FORMATS = {
+    "arrow":   ("application/vnd.apache.arrow.file", "arrow"),
+    "parquet": ("application/vnd.apache.parquet",    "parquet"),
+    "npz":     ("application/x-npz",                 "npz")
+}
+
+def available_formats():
+    """Export formats supported by the installed packages, most preferred
+    first."""
+    if pa is None:
+        return ["npz"]
+    return ["arrow", "parquet", "npz"]
+
+def format_for_mimetype(mimetype):
+    for fmt, (fmt_mimetype, _) in EXPORT_FORMATS.items():
+        if fmt_mimetype == mimetype:
+            return fmt
+    return None
+
+def npz_columns(df):
+    """Columns of a DataFrame as NumPy arrays which can be loaded without
+    pickle. Object (string) columns become unicode arrays, with missing
+    values as empty strings."""
+    columns = {}
+    for col in df.columns:
+        values = df[col]
+        if values.dtype == object:
+            columns[str(col)] = values.fillna("").astype(str).to_numpy(dtype=str)
+        else:
+            columns[str(col)] = values.to_numpy()
+    return columns
+
+def export_table(df, fmt):
+    """Encode a DataFrame in one of the `EXPORT_FORMATS`.
+
+    args:
+        df  - DataFrame to encode, its index is not included
+        fmt - Name of the format, see `available_formats`
+    returns:
+        Encoded bytes"""
+    if fmt not in available_formats():
+        raise ValueError(f"Unsupported export format: {fmt}")
+
+    buffer = io.BytesIO()
+    if fmt == "npz":
+        np.savez_compressed(buffer, **npz_columns(df))
+    else:
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        if fmt == "arrow":
+            with pa.ipc.new_file(buffer, table.schema) as writer:
+                writer.write_table(table)
+        else:
+            pq.write_table(table, buffer)
+    return buffer.getvalue()
@@ -0,0 +1,172 @@
+# MIT License
+#
+# Copyright (c) 2023 MEng-Team-Project
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+"""Background job queue for long running analysis subprocesses."""
+
+import collections
+import logging
+import re
+import subprocess
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+# Progress of the tracker is logged per frame as `... (frame/frames) ...`
+PROGRESS_RE = re.compile(r"\((\d+)/(\d+)\)")
+
+QUEUED    = "queued"
+RUNNING   = "running"
+SUCCEEDED = "succeeded"
+FAILED    = "failed"
+
+
+class Job(object):
+    """State of a single subprocess run by a `JobQueue`.
+
+    args:
+        args       - Command line of the subprocess
+        cwd        - (Optional) Working directory of the subprocess
+        on_success - (Optional) Function `on_success(job)` run by the worker
+                     after the subprocess exits successfully
+        info       - (Optional) Dict of extra information to report"""
+
+    def __init__(self, args, cwd=None, on_success=None, info=None):
+        self.id         = uuid.uuid4().hex
+        self.args       = args
+        self.cwd        = cwd
+        self.on_success = on_success
+        self.info       = info or {}
+        self.state      = QUEUED
+        self.progress   = None
+        self.returncode = None
+        self.error      = None
+        self.output     = collections.deque(maxlen=20) # Last lines of output
+        self.submitted  = time.time()
+        self.started    = None
+        self.finished   = None
+
+    @property
+    def done(self):
+        return self.state in (SUCCEEDED, FAILED)
+
+    def update_progress(self, line):
+        match = PROGRESS_RE.search(line)
+        if match:
+            current, total = map(int, match.groups())
+            if total > 0:
+                self.progress = current / total
+
+    def to_dict(self):
+        if self.started is None:
+            wall_time = None
+        else:
+            wall_time = (self.finished or time.time()) - self.started
+        return {
+            "id":         self.id,
+            "state":      self.state,
+            "progress":   self.progress,
+            "submitted":  self.submitted,
+            "started":    self.started,
+            "finished":   self.finished,
+            "wall_time":  wall_time,
+            "returncode": self.returncode,
+            "error":      self.error,
+            "output":     list(self.output),
+            **self.info
+        }
+
+
+class JobQueue(object):
+    """Runs subprocesses on a bounded pool of worker threads, so callers can
+    submit work and poll for its state instead of blocking on it.
+
+    args:
+        max_workers - Maximum number of subprocesses run at once
+        max_history - (Optional) Number of finished jobs to remember"""
+
+    def __init__(self, max_workers, max_history=1000):
+        self.max_workers = max_workers
+        self.max_history = max_history
+        self._jobs       = collections.OrderedDict()
+        self._lock       = threading.Lock()
+        self._executor   = None
+
+    def submit(self, args, cwd=None, on_success=None, info=None):
+        job = Job(args, cwd, on_success, info)
+        with self._lock:
+            # The pool is created on first use so `max_workers` can be
+            # configured after construction
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers, thread_name_prefix="job")
+            self._jobs[job.id] = job
+            self._forget_finished()
+        self._executor.submit(self._run, job)
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def jobs(self):
+        with self._lock:
+            return list(self._jobs.values())
+
+    def shutdown(self, wait=True):
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait)
+
+    def _forget_finished(self):
+        finished = [job_id for job_id, job in self._jobs.items() if job.done]
+        for job_id in finished[:max(0, len(finished) - self.max_history)]:
+            del self._jobs[job_id]
+
+    def _run(self, job):
+        job.state   = RUNNING
+        job.started = time.time()
+        try:
+            process = subprocess.Popen(
+                job.args,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
+                cwd=job.cwd,
+                text=True,
+                errors="replace")
+            # Text mode also splits lines on the carriage returns used to
+            # redraw progress
+            for line in process.stdout:
+                line = line.rstrip()
+                if line:
+                    job.output.append(line)
+                    job.update_progress(line)
+            job.returncode = process.wait()
+            if job.returncode != 0:
+                raise RuntimeError(f"Exited with code {job.returncode}")
+            if job.on_success is not None:
+                job.on_success(job)
+            job.state = SUCCEEDED
+        except Exception as e:
+            logging.warning("Job %s failed: %s", job.id, e)
+            job.error = str(e)
+            job.state = FAILED
+        finally:
+            job.finished = time.time()
@@ -0,0 +1,213 @@
+# MIT License
+#
+# Copyright (c) 2023 MEng-Team-Project
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+"""Minimal in-process metrics (counters and histograms) rendered in the
+Prometheus text exposition format, for timing each stage of the
+microservice endpoints. With multiple worker processes every worker keeps
+its own metrics."""
+
+import math
+import threading
+import time
+
+# Upper bounds (seconds) of the latency histogram buckets
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25,
+                   0.5, 1.0, 2.5, 5.0, 10.0, 30.0, math.inf)
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    if value == -math.inf:
+        return "-Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    escape = lambda value: str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+    return "{" + ",".join(f'{name}="{escape(value)}"' for name, value in labels) + "}"
+
+class _Metric(object):
+    """Metric with values split by a fixed set of label names."""
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name          = name
+        self.documentation = documentation
+        self.labelnames    = tuple(labelnames)
+        self._values       = {}
+        self._lock         = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {sorted(labels)}")
+        return tuple(labels[name] for name in self.labelnames)
+
+class Counter(_Metric):
+    """Monotonically increasing count, optionally split by labels."""
+
+    type = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def samples(self):
+        """List of (name, labels, value) samples."""
+        with self._lock:
+            return [(self.name, list(zip(self.labelnames, key)), value)
+                    for key, value in sorted(self._values.items())]
+
+class Histogram(_Metric):
+    """Distribution of observed values (e.g. latencies) in cumulative
+    buckets, optionally split by labels."""
+
+    type = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super(Histogram, self).__init__(name, documentation, labelnames)
+        buckets = sorted(buckets)
+        if buckets[-1] != math.inf:
+            buckets.append(math.inf)
+        self.buckets = tuple(buckets) # Values are (bucket counts, sum)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * len(self.buckets), 0.0))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            self._values[key] = (counts, total + value)
+
+    def count(self, **labels):
+        with self._lock:
+            counts, _ = self._values.get(self._key(labels), ([0], 0.0))
+        return sum(counts)
+
+    def samples(self):
+        """List of (name, labels, value) samples, with cumulative bucket
+        counts."""
+        samples = []
+        with self._lock:
+            for key, (counts, total) in sorted(self._values.items()):
+                labels     = list(zip(self.labelnames, key))
+                cumulative = 0
+                for bound, count in zip(self.buckets, counts):
+                    cumulative += count
+                    samples.append((f"{self.name}_bucket",
+                                    labels + [("le", _format_value(bound))], cumulative))
+                samples.append((f"{self.name}_sum",   labels, total))
+                samples.append((f"{self.name}_count", labels, cumulative))
+        return samples
+
+class Registry(object):
+    """Set of metrics, and of collectors which report values owned by
+    other objects (e.g. cache statistics) when the metrics are rendered."""
+
+    def __init__(self):
+        self._metrics    = []
+        self._collectors = []
+
+    def counter(self, name, documentation, labelnames=()):
+        metric = Counter(name, documentation, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        metric = Histogram(name, documentation, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def collector(self, collect):
+        """Register a function returning a list of
+        `(name, type, documentation, [(labels_dict, value), ...])` tuples."""
+        self._collectors.append(collect)
+        return collect
+
+    def render(self):
+        """Render every metric in the Prometheus text exposition format."""
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        for collect in self._collectors:
+            for name, metric_type, documentation, samples in collect():
+                lines.append(f"# HELP {name} {documentation}")
+                lines.append(f"# TYPE {name} {metric_type}")
+                for labels, value in samples:
+                    lines.append(f"{name}{_format_labels(sorted(labels.items()))} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.histogram(
+    "traffic_ml_stage_seconds", "Time spent in each stage of an endpoint.",
+    ["endpoint", "stage"])
+REQUEST_SECONDS = REGISTRY.histogram(
+    "traffic_ml_request_seconds", "Time spent handling a request.",
+    ["endpoint", "status"])
+ROWS_PROCESSED = REGISTRY.counter(
+    "traffic_ml_rows_processed_total", "Rows (detections, tracks or points) processed by each stage.",
+    ["endpoint", "stage"])
+
+class StageTimer(object):
+    """Times consecutive stages of handling a request. Each `lap` records
+    the time since the previous lap (or the start) as a stage.
+
+    Usage:
+        timer = StageTimer("routes")
+        data  = load()
+        timer.lap("load", rows=len(data))
+        ...
+        timer.finish()
+    """
+
+    def __init__(self, endpoint):
+        self.endpoint = endpoint
+        self.start    = time.perf_counter()
+        self.last     = self.start
+        self.stages   = []
+
+    def lap(self, stage, rows=None):
+        now     = time.perf_counter()
+        seconds = now - self.last
+        self.last = now
+        self.stages.append((stage, seconds))
+        STAGE_SECONDS.observe(seconds, endpoint=self.endpoint, stage=stage)
+        if rows is not None:
+            ROWS_PROCESSED.inc(rows, endpoint=self.endpoint, stage=stage)
+        return seconds
+
+    def finish(self, status="ok"):
+        """Record the time of the whole request, returns it in seconds."""
+        seconds = time.perf_counter() - self.start
+        REQUEST_SECONDS.observe(seconds, endpoint=self.endpoint, status=status)
+        return seconds
@@ -0,0 +1,62 @@
+# MIT License
+#
+# Copyright (c) 2023 MEng-Team-Project
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+"""Profiling of single requests with cProfile, to find out why a particular
+request is slow without attaching a debugger."""
+
+import cProfile
+import os
+import pstats
+import tempfile
+import time
+
+def profile_call(func, *args, **kwargs):
+    """Call `func` under cProfile.
+
+    returns:
+        (result, profiler) - Return value of `func` and its profile"""
+    profiler = cProfile.Profile()
+    result   = profiler.runcall(func, *args, **kwargs)
+    return result, profiler
+
+def top_functions(profiler, n=30):
+    """The `n` functions with the highest cumulative time of a profile, as
+    a list of dicts with the function, number of calls and its total
+    (excluding sub-calls) and cumulative time in seconds."""
+    stats = pstats.Stats(profiler).stats
+    rows  = sorted(stats.items(), key=lambda item: item[1][3], reverse=True)[:n]
+    return [{
+        "function":        pstats.func_std_string(func),
+        "calls":           n_calls,
+        "total_time":      total_time,
+        "cumulative_time": cumulative_time
+    } for func, (_, n_calls, total_time, cumulative_time, _) in rows]
+
+def write_profile(profiler, directory, name):
+    """Write a profile to a uniquely named `{directory}/{name}-{time}-*.prof`
+    file, which can be read with `pstats` or e.g. snakeviz. Returns the path
+    written to."""
+    os.makedirs(directory, exist_ok=True)
+    fd, path = tempfile.mkstemp(
+        prefix=f"{name}-{time.strftime('%Y%m%d-%H%M%S')}-", suffix=".prof", dir=directory)
+    os.close(fd)
+    profiler.dump_stats(path)
+    return path
@@ -0,0 +1,176 @@
+# MIT License
+#
+# Copyright (c) 2023 MEng-Team-Project
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+"""Assign points to route regions. Route regions are supplied by the
+frontend as `{name: [[x, y], ...]}` polygons in image coordinates."""
+
+import hashlib
+import json
+import math
+
+import numpy as np
+
+import shapely
+from shapely.geometry import Polygon
+
+# Vectorized predicates are only available from Shapely 2.0
+HAS_CONTAINS_XY = hasattr(shapely, "contains_xy")
+
+def region_polygons(regions):
+    """Build a `{name: Polygon}` dict from route region coordinates."""
+    return {name: Polygon(coords) for name, coords in regions.items()}
+
+def points_in_polygon(xs, ys, coords):
+    """NumPy ray casting test of which points are inside a polygon. Used
+    when Shapely's vectorized predicates are unavailable. Points exactly on
+    an edge may be classified either way.
+
+    args:
+        xs, ys - Point coordinate arrays
+        coords - Polygon vertices as `[[x, y], ...]`
+    returns:
+        Boolean array, True where the point is inside the polygon"""
+    xs, ys = np.asarray(xs, dtype=float), np.asarray(ys, dtype=float)
+    poly   = np.asarray(coords, dtype=float)
+    inside = np.zeros(xs.shape, dtype=bool)
+    x0, y0 = poly[:, 0], poly[:, 1]
+    x1, y1 = np.roll(x0, -1), np.roll(y0, -1)
+    for ax, ay, bx, by in zip(x0, y0, x1, y1):
+        if ay == by:
+            continue # Horizontal edges never cross the ray
+        crosses = (ay > ys) != (by > ys)
+        x_cross = ax + (ys - ay) * (bx - ax) / (by - ay)
+        inside ^= crosses & (xs < x_cross)
+    return inside
+
+def points_within(xs, ys, polygon):
+    """Boolean array of which points are strictly within a polygon, which
+    matches `Point(x, y).within(polygon)`."""
+    if HAS_CONTAINS_XY:
+        shapely.prepare(polygon)
+        return shapely.contains_xy(polygon, xs, ys)
+    return points_in_polygon(xs, ys, polygon.exterior.coords)
+
+def classify_points(xs, ys, regions):
+    """Label each point with the first region (in dict order) it lies in.
+
+    args:
+        xs, ys  - Point coordinate arrays
+        regions - Route regions as `{name: coords}` or `{name: Polygon}`
+    returns:
+        Object array of region names, NaN where a point is in no region"""
+    xs     = np.asarray(xs, dtype=float)
+    ys     = np.asarray(ys, dtype=float)
+    labels = np.full(xs.shape, np.nan, dtype=object)
+    unassigned = np.ones(xs.shape, dtype=bool)
+    for name, polygon in regions.items():
+        if not unassigned.any():
+            break
+        if not isinstance(polygon, Polygon):
+            polygon = Polygon(polygon)
+        hit = unassigned.copy()
+        hit[unassigned] = points_within(xs[unassigned], ys[unassigned], polygon)
+        labels[hit]      = name
+        unassigned[hit]  = False
+    return labels
+
+def regions_hash(regions):
+    """Canonical hash of a region set. Region order is kept as it decides
+    which region a point in overlapping regions belongs to."""
+    canonical = json.dumps(
+        [[name, [[float(x), float(y)] for x, y in coords]]
+         for name, coords in regions.items()],
+        separators=(",", ":"))
+    return hashlib.sha1(canonical.encode("utf-8")).hexdigest()
+
+
+# Largest raster grid, in cells, a region map may be built at (128MB of
+# int16 codes)
+MAX_RASTER_CELLS = 64 * 1024 * 1024
+
+
+class RegionMap(object):
+    """Region set rasterized into a label image, so points are labelled by
+    array indexing instead of geometry tests. Each grid cell takes the
+    region of its centre point, so points within one cell of a region's
+    edge may be labelled as the neighbouring cell.
+
+    args:
+        regions   - Route regions as `{name: coords}`
+        width     - Width of the video frame in pixels
+        height    - Height of the video frame in pixels
+        scale     - (Optional) Grid cells per pixel, e.g. 0.5 for a grid at
+                    half of the frame resolution
+        max_cells - (Optional) Largest grid allowed, in cells
+
+    Raises a ValueError if `scale` is not positive or the grid would have
+    more than `max_cells` cells."""
+
+    def __init__(self, regions, width, height, scale=1.0, max_cells=MAX_RASTER_CELLS):
+        self.scale = float(scale)
+        if not math.isfinite(self.scale) or self.scale <= 0:
+            raise ValueError(f"Raster scale must be positive, got {scale}")
+        self.width  = max(int(math.ceil(width  * self.scale)), 1)
+        self.height = max(int(math.ceil(height * self.scale)), 1)
+        if self.width * self.height > max_cells:
+            raise ValueError(
+                f"Raster grid of {self.width}x{self.height} cells is larger than "
+                f"the limit of {max_cells} cells, use a smaller raster scale")
+        self.names  = np.array(list(regions.keys()) + [np.nan], dtype=object)
+        self.codes  = self._rasterize(regions)
+
+    @property
+    def nbytes(self):
+        return self.codes.nbytes + self.names.nbytes
+
+    def _rasterize(self, regions):
+        # -1 (the trailing NaN name) marks cells which are in no region
+        codes = np.full((self.height, self.width), -1, dtype=np.int16)
+        for code, coords in enumerate(regions.values()):
+            polygon = Polygon(coords)
+            if polygon.is_empty:
+                continue
+            minx, miny, maxx, maxy = polygon.bounds
+            c0 = max(int(math.floor(minx * self.scale)), 0)
+            r0 = max(int(math.floor(miny * self.scale)), 0)
+            c1 = min(int(math.ceil(maxx * self.scale)) + 1, self.width)
+            r1 = min(int(math.ceil(maxy * self.scale)) + 1, self.height)
+            if c0 >= c1 or r0 >= r1:
+                continue
+            # Only test cells within the region's bounding box, skipping
+            # cells already claimed by an earlier region
+            window = codes[r0:r1, c0:c1]
+            rows, cols = np.nonzero(window == -1)
+            xs = (cols + c0 + 0.5) / self.scale
+            ys = (rows + r0 + 0.5) / self.scale
+            inside = points_within(xs, ys, polygon)
+            window[rows[inside], cols[inside]] = code
+        return codes
+
+    def classify(self, xs, ys):
+        """Label each point with its region, NaN where it is in no region or
+        outside of the frame. Same output format as `classify_points`."""
+        cols = np.floor(np.asarray(xs, dtype=float) * self.scale)
+        rows = np.floor(np.asarray(ys, dtype=float) * self.scale)
+        valid = (cols >= 0) & (cols < self.width) & (rows >= 0) & (rows < self.height)
+        codes = np.full(cols.shape, -1, dtype=np.int16)
+        codes[valid] = self.codes[rows[valid].astype(np.intp), cols[valid].astype(np.intp)]
+        return self.names[codes]
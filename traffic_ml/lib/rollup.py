@@ -0,0 +1,298 @@
+# MIT License
+#
+# Copyright (c) 2023 MEng-Team-Project
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+"""Time bucket rollups of per-track route times, so route analytics over
+long recordings can be counted from a few rows per bucket instead of every
+track.
+
+A track is counted in the interval containing its start time, or in the
+next interval if the midpoint of its start and end time is past the end of
+the interval (see `analytics.assign_intervals`). When every interval starts
+and ends on a bucket boundary, both only depend on the buckets of the
+track's start and midpoint time. Tracks with the same label, start and end
+region and start and midpoint bucket are therefore counted together, at
+1 minute granularity, and rolled up to coarser buckets from there.
+
+Tracks are only counted together with tracks starting in the same bucket
+of the coarsest size. A track's start never changes as detections are
+appended, so the rollup of a growing stream is extended by rolling up
+only the coarsest buckets of the tracks with new detections again."""
+
+import sys
+
+import numpy as np
+import pandas as pd
+
+from traffic_ml.lib.analytics  import frames_to_us
+from traffic_ml.lib.trajectory import TRACK_KEYS, merge_endpoints
+
+# Rollup bucket sizes, each a multiple of the previous one
+ROLLUP_MINUTES = (1, 5, 15, 60)
+MINUTE_US      = 60 * 1000000
+
+ROUTE_COLUMNS = ["label", "start_region", "end_region"]
+
+# Largest number of coarsest buckets a rollup is extended in, rather than
+# being rebuilt
+MAX_EXTENDED_BUCKETS = 4
+
+# Per-track route state, in the same format as track endpoints so the
+# route state of consecutive runs of detections can be merged
+ROUTE_STATE_COLUMNS = TRACK_KEYS + [
+    "start_time", "start_region", "end_time", "end_region", "n_points"]
+
+# Tracks are counted in order of start and end time, then by track
+COUNT_ORDER = ["start_time", "end_time"] + TRACK_KEYS
+
+def track_routes(endpoints_df, classify, fps):
+    """Route state of each track from its endpoints: the region and time
+    of its first and last point. Times are in microseconds since the start
+    of the recording.
+
+    args:
+        endpoints_df - Track endpoints by frame, e.g. `db.summarise_tracks`
+        classify     - Function `classify(xs, ys)` labelling points with
+                       their region
+        fps          - Frames per second of the recording
+    returns:
+        DataFrame with the `ROUTE_STATE_COLUMNS`, sorted by track"""
+    return pd.DataFrame({
+        "label":        endpoints_df["label"].to_numpy(),
+        "det_id":       endpoints_df["det_id"].to_numpy(),
+        "start_time":   frames_to_us(endpoints_df["start_frame"].to_numpy(), 0, fps),
+        "start_region": classify(endpoints_df["start_x"].to_numpy(), endpoints_df["start_y"].to_numpy()),
+        "end_time":     frames_to_us(endpoints_df["end_frame"].to_numpy(), 0, fps),
+        "end_region":   classify(endpoints_df["end_x"].to_numpy(), endpoints_df["end_y"].to_numpy()),
+        "n_points":     endpoints_df["n_points"].to_numpy()
+    }, columns=ROUTE_STATE_COLUMNS)
+
+def midpoint_times(start_times, end_times):
+    """Integer (microsecond) time which is at or after the end of an
+    interval exactly when `assign_intervals` moves a track starting at
+    `start_times` and ending at `end_times` into the next interval, i.e.
+    `ceil - start <= end - ceil` and `end > ceil` with `ceil` the last
+    microsecond of the interval."""
+    start_times = np.asarray(start_times, dtype=np.int64)
+    end_times   = np.asarray(end_times,   dtype=np.int64)
+    return np.where(end_times > start_times, (start_times + end_times + 2) // 2, start_times)
+
+def roll_up(buckets_df, bucket_us):
+    """Count the tracks (or counts of a finer rollup) of `buckets_df` by
+    route and `bucket_us` wide start and midpoint bucket. `start_time` and
+    `mid_time` become the start of their bucket, `count` is summed and
+    `first` (the position of the first track) is kept for ordering."""
+    rolled_df = buckets_df[ROUTE_COLUMNS].copy()
+    rolled_df["start_time"] = (buckets_df["start_time"].to_numpy() // bucket_us) * bucket_us
+    rolled_df["mid_time"]   = (buckets_df["mid_time"].to_numpy()   // bucket_us) * bucket_us
+    rolled_df["count"]      = buckets_df["count"].to_numpy()
+    rolled_df["first"]      = buckets_df["first"].to_numpy()
+    # Summed separately, named aggregation is several times slower
+    groups    = rolled_df.groupby(ROUTE_COLUMNS + ["start_time", "mid_time"], sort=False)
+    rolled_df = groups["count"].sum().to_frame()
+    rolled_df["first"] = groups["first"].min()
+    rolled_df = rolled_df.reset_index()
+    return rolled_df.sort_values("first", kind="mergesort").reset_index(drop=True)
+
+def count_order(routes_df):
+    """Indexer which sorts route state in `COUNT_ORDER`."""
+    labels, _ = pd.factorize(routes_df["label"], sort=True)
+    return np.lexsort((routes_df["det_id"].to_numpy(), labels,
+                       routes_df["end_time"].to_numpy(), routes_df["start_time"].to_numpy()))
+
+def roll_up_tracks(routes_df, bucket_sizes):
+    """Roll up route state in `COUNT_ORDER`.
+
+    args:
+        routes_df    - Route state of tracks, see `track_routes`
+        bucket_sizes - Bucket sizes (microseconds), each a multiple of the
+                       last
+    returns:
+        (tracks_df, levels) - Tracks with a route, with a `count` of 1 and
+                              their position in `first`, and the rollup of
+                              each bucket size, see `roll_up`"""
+    tracks_df = routes_df[ROUTE_COLUMNS + ["start_time", "end_time"]].reset_index(drop=True)
+    tracks_df["first"] = np.arange(len(tracks_df))
+
+    # Tracks without a route are never counted
+    routed = tracks_df["start_region"].notna() & tracks_df["end_region"].notna() & \
+             (tracks_df["start_region"] != tracks_df["end_region"])
+    tracks_df = tracks_df[routed].reset_index(drop=True)
+    tracks_df["count"] = 1
+
+    levels     = {}
+    buckets_df = tracks_df.assign(mid_time=midpoint_times(
+        tracks_df["start_time"], tracks_df["end_time"]))
+    for bucket_us in bucket_sizes:
+        buckets_df = roll_up(buckets_df, bucket_us)
+        levels[bucket_us] = buckets_df
+    return tracks_df, levels
+
+def last_tracks(routes_df, bucket_us):
+    """The last track of each class in each `bucket_us` wide bucket of
+    start times, of route state in `COUNT_ORDER`."""
+    last_df = routes_df[["label", "end_time"]].assign(
+        bucket=routes_df["start_time"].to_numpy() // bucket_us)
+    return last_df.drop_duplicates(["bucket", "label"], keep="last").reset_index(drop=True)
+
+def splice(df, start, stop, new_df, shift):
+    """Replace the rows of a table sorted by `first` whose `first` is in
+    `[start, stop)` with `new_df`, numbered from `start`, and shift the
+    `first` of the rows after them by `shift`."""
+    lo, hi = np.searchsorted(df["first"].to_numpy(), [start, stop])
+    parts  = [df.iloc[:lo],
+              new_df.assign(first=new_df["first"] + start),
+              df.iloc[hi:].assign(first=df["first"].iloc[hi:] + shift)]
+    # Empty parts are left out so they can't change column types
+    parts  = [part for part in parts if len(part) > 0]
+    return pd.concat(parts, ignore_index=True) if parts else df.iloc[:0]
+
+
+class RouteRollup(object):
+    """Rollup pyramid of the route times of every track of a stream.
+    Rollups are not modified once built, `extend` returns a new one.
+
+    args:
+        routes_df - Route state of every track, see `track_routes`
+        minutes   - Bucket sizes (minutes), each a multiple of the last
+    """
+
+    def __init__(self, routes_df, minutes=ROLLUP_MINUTES):
+        self.minutes      = tuple(sorted(minutes))
+        self.bucket_sizes = [bucket_minutes * MINUTE_US for bucket_minutes in self.minutes]
+
+        self.routes = routes_df[ROUTE_STATE_COLUMNS].take(count_order(routes_df)).reset_index(drop=True)
+        self.tracks, self.levels = roll_up_tracks(self.routes, self.bucket_sizes)
+
+        # Coarsest bucket of each track's start, which it is rolled up
+        # within, to find the rows of the tracks new detections are added to
+        buckets = self.routes["start_time"].to_numpy() // self.bucket_sizes[-1]
+        self.track_buckets = dict(zip(
+            zip(self.routes["label"].tolist(), self.routes["det_id"].tolist()), buckets.tolist()))
+        self.bucket_last = last_tracks(self.routes, self.bucket_sizes[-1])
+        self.last_tracks = self.bucket_last.drop_duplicates("label", keep="last")[["label", "end_time"]]
+
+    def extend(self, new_routes_df):
+        """Rollup with the route state of detections written since this
+        one was built added, see `trajectory.merge_endpoints`. Tracks are
+        only rolled up with tracks starting in the same coarsest bucket, so
+        only the buckets of tracks with new detections are rolled up again.
+
+        args:
+            new_routes_df - Route state of the new detections only, see
+                            `track_routes`
+        returns:
+            New `RouteRollup`"""
+        if len(new_routes_df) == 0:
+            return self
+        new_routes_df = new_routes_df[ROUTE_STATE_COLUMNS]
+
+        # Tracks stay in the bucket of their first detection
+        bucket_us = self.bucket_sizes[-1]
+        keys      = list(zip(new_routes_df["label"].tolist(), new_routes_df["det_id"].tolist()))
+        starts    = (new_routes_df["start_time"].to_numpy() // bucket_us).tolist()
+        buckets   = np.array([self.track_buckets.get(key, start) for key, start in zip(keys, starts)])
+
+        # Every table is copied for each bucket, so new detections of tracks
+        # in many buckets are rolled up again from scratch
+        if len(np.unique(buckets)) > MAX_EXTENDED_BUCKETS:
+            return RouteRollup(merge_endpoints(self.routes, new_routes_df), self.minutes)
+
+        routes_df, tracks_df, levels = self.routes, self.tracks, dict(self.levels)
+        bucket_last = self.bucket_last
+        # Later buckets first, so the rows of earlier ones don't move
+        for bucket in np.unique(buckets)[::-1]:
+            start, stop = np.searchsorted(
+                routes_df["start_time"].to_numpy(), [bucket * bucket_us, (bucket + 1) * bucket_us])
+            bucket_df = merge_endpoints(routes_df.iloc[start:stop], new_routes_df[buckets == bucket])
+            bucket_df = bucket_df.take(count_order(bucket_df))
+            bucket_tracks_df, bucket_levels = roll_up_tracks(bucket_df, self.bucket_sizes)
+
+            shift     = len(bucket_df) - (stop - start)
+            routes_df = pd.concat(
+                [routes_df.iloc[:start], bucket_df, routes_df.iloc[stop:]], ignore_index=True)
+            lo, hi = np.searchsorted(bucket_last["bucket"].to_numpy(), [bucket, bucket + 1])
+            bucket_last = pd.concat([bucket_last.iloc[:lo], last_tracks(bucket_df, bucket_us),
+                                     bucket_last.iloc[hi:]], ignore_index=True)
+            tracks_df = splice(tracks_df, start, stop, bucket_tracks_df, shift)
+            for level_us in levels:
+                levels[level_us] = splice(levels[level_us], start, stop, bucket_levels[level_us], shift)
+
+        rollup = RouteRollup.__new__(RouteRollup)
+        rollup.minutes       = self.minutes
+        rollup.bucket_sizes  = self.bucket_sizes
+        rollup.routes        = routes_df
+        rollup.tracks        = tracks_df
+        rollup.levels        = levels
+        rollup.track_buckets = dict(self.track_buckets)
+        rollup.track_buckets.update(zip(keys, buckets.tolist()))
+        rollup.bucket_last   = bucket_last
+        rollup.last_tracks   = bucket_last.drop_duplicates("label", keep="last")[["label", "end_time"]]
+        return rollup
+
+    @property
+    def nbytes(self):
+        frames = [self.routes, self.bucket_last, self.last_tracks, self.tracks] + list(self.levels.values())
+        return int(sum(df.memory_usage(deep=True).sum() for df in frames)) + \
+            sys.getsizeof(self.track_buckets)
+
+    def bucket_for(self, floors, ceils):
+        """Largest bucket size (microseconds) which every interval starts
+        and ends on a boundary of, or None if there is none.
+
+        args:
+            floors - Inclusive start time of each interval
+            ceils  - Inclusive end time of each interval"""
+        floors = np.asarray(floors, dtype=np.int64)
+        ends   = np.asarray(ceils,  dtype=np.int64) + 1
+        for bucket_us in sorted(self.levels, reverse=True):
+            if np.all(floors % bucket_us == 0) and np.all(ends % bucket_us == 0):
+                return bucket_us
+        return None
+
+    def last_end_time(self, classes):
+        """End time of the last track of the given classes. Raises an
+        IndexError if there are none."""
+        last_tracks = self.last_tracks[self.last_tracks["label"].isin(classes)]
+        return last_tracks["end_time"].iloc[-1]
+
+    def route_times(self, floors, ceils, classes):
+        """Route times to count tracks of the given classes in the given
+        intervals from, with a `count` of tracks per row. Rows come from
+        the coarsest rollup level the intervals are aligned to, with
+        `start_time` and `end_time` standing in for every track counted in
+        them, or are the tracks themselves if the intervals aren't aligned
+        to any level.
+
+        returns:
+            (route_times_df, bucket_us) - Route times in the order they are
+                                          counted, and the bucket size used
+                                          (None for tracks)"""
+        bucket_us = self.bucket_for(floors, ceils)
+        if bucket_us is None:
+            route_times_df = self.tracks
+        else:
+            # A track ending at twice its midpoint bucket from the start of
+            # its start bucket moves to the next interval like the tracks
+            # it stands in for
+            route_times_df = self.levels[bucket_us].assign(
+                end_time=lambda df: 2 * df["mid_time"] - df["start_time"])
+        route_times_df = route_times_df[route_times_df["label"].isin(classes)]
+        return route_times_df, bucket_us
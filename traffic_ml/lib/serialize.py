@@ -0,0 +1,183 @@
+# MIT License
+#
+# Copyright (c) 2023 MEng-Team-Project
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+"""Incremental JSON encoding of large responses, so they can be streamed
+to the client instead of being built in memory first."""
+
+import base64
+import binascii
+import itertools
+import json
+import math
+
+import numpy as np
+import pandas as pd
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Most decimal places pandas' JSON encoder can round to
+MAX_PRECISION = 15
+
+def check_precision(precision):
+    """Raise a ValueError unless `precision` is None or a whole number of
+    decimal places from 0 to `MAX_PRECISION`."""
+    if precision is None:
+        return
+    if isinstance(precision, bool) or not isinstance(precision, int) or \
+       not 0 <= precision <= MAX_PRECISION:
+        raise ValueError(
+            f"precision must be a whole number from 0 to {MAX_PRECISION}, got {precision!r}")
+
+def _default(obj, precision=None):
+    """Convert pandas and NumPy values into JSON encodable values, with
+    missing (NaN) and infinite values as None and floats optionally rounded.
+    DataFrames become lists of records and Series become dicts, in the same
+    format as `to_json(orient="records")` and `to_json(orient="index")`."""
+    if isinstance(obj, pd.DataFrame):
+        # Much faster than `to_dict(orient="records")`, which boxes every
+        # value separately
+        columns = [str(col) for col in obj.columns]
+        values  = [_default(obj[col].to_numpy(), precision) for col in obj.columns]
+        return [dict(zip(columns, row)) for row in zip(*values)]
+    if isinstance(obj, pd.Series):
+        return dict(zip(map(str, obj.index), _default(obj.to_numpy(), precision)))
+    if isinstance(obj, np.ndarray):
+        if obj.dtype.kind == "f":
+            if precision is not None:
+                obj = np.round(obj, precision)
+            missing = ~np.isfinite(obj)
+        elif obj.dtype.kind == "O":
+            missing = pd.isna(obj)
+        else:
+            missing = None
+        values = obj.tolist()
+        if obj.dtype.kind == "O":
+            # Elements of object arrays are left as they are, e.g. NumPy
+            # scalars of a mixed type Series
+            values = [_prepare(value, precision) for value in values]
+        if missing is not None and missing.any():
+            for i in np.flatnonzero(missing):
+                values[i] = None
+        return values
+    if isinstance(obj, np.generic):
+        return _prepare(obj.item(), precision)
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+def _prepare(obj, precision=None):
+    """Recursively convert a value into one `json.dumps` can encode, see
+    `_default`."""
+    if isinstance(obj, float):
+        if not math.isfinite(obj):
+            return None
+        return obj if precision is None else round(obj, precision)
+    if isinstance(obj, dict):
+        return {str(key): _prepare(value, precision) for key, value in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [_prepare(value, precision) for value in obj]
+    if isinstance(obj, (pd.DataFrame, pd.Series, np.ndarray, np.generic)):
+        return _default(obj, precision)
+    return obj
+
+def dumps(obj, precision=None):
+    """Encode a response as compact JSON bytes with sorted keys, directly
+    from any nested pandas and NumPy values. NaN is encoded as null. Uses
+    orjson if it is installed.
+
+    args:
+        obj       - Value to encode
+        precision - (Optional) Number of decimal places to round floats to,
+                    see `check_precision`
+    returns:
+        JSON encoded bytes"""
+    check_precision(precision)
+    if orjson is not None:
+        # Plain Python floats are only visited when they have to be rounded
+        if precision is not None:
+            obj = _prepare(obj, precision)
+        return orjson.dumps(
+            obj,
+            default=lambda value: _default(value, precision),
+            option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_SORT_KEYS |
+                   orjson.OPT_NON_STR_KEYS)
+    return json.dumps(
+        _prepare(obj, precision), sort_keys=True, separators=(",", ":"),
+        allow_nan=False).encode("utf-8")
+
+def iter_records(df, chunk_rows=10000, precision=None):
+    """Encode a DataFrame as a JSON array of records, yielding it a chunk of
+    rows at a time. Uses pandas' own encoder, which is faster than `dumps`
+    for large tables but does not sort the keys of each record. `precision`
+    is checked at once, before any chunk is encoded.
+
+    args:
+        df         - DataFrame to encode
+        chunk_rows - (Optional) Number of rows encoded per chunk
+        precision  - (Optional) Number of decimal places to round floats to,
+                     see `check_precision`
+    returns:
+        Generator of JSON encoded bytes"""
+    check_precision(precision)
+    return _record_chunks(df, chunk_rows, MAX_PRECISION if precision is None else precision)
+
+def _record_chunks(df, chunk_rows, precision):
+    yield b"["
+    for start in range(0, len(df), chunk_rows):
+        chunk = df.iloc[start:start + chunk_rows].to_json(
+            orient="records", double_precision=precision)
+        yield (b"," if start else b"") + chunk[1:-1].encode("utf-8")
+    yield b"]"
+
+def iter_object(obj, key, value_chunks, precision=None):
+    """Encode a JSON object with one extra field whose value is streamed.
+    The other fields are encoded at once, so encoding errors are raised
+    before anything is streamed.
+
+    args:
+        obj          - Dict of the other fields
+        key          - Name of the streamed field, which is encoded last
+        value_chunks - Iterable of JSON encoded chunks of the streamed value
+        precision    - (Optional) Number of decimal places to round floats
+                       of `obj` to
+    returns:
+        Iterator of JSON encoded bytes"""
+    head = dumps(obj, precision)[:-1] # Without the closing brace
+    head = head + (b"," if obj else b"") + dumps(key) + b":"
+    return itertools.chain([head], value_chunks, [b"}"])
+
+def encode_cursor(key):
+    """Encode the key of the last row of a page as an opaque, URL safe
+    cursor for the next page."""
+    return base64.urlsafe_b64encode(dumps(key)).decode("ascii").rstrip("=")
+
+def decode_cursor(cursor):
+    """Decode a cursor from `encode_cursor` back into its key. Raises a
+    ValueError if the cursor is malformed."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        key    = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+    except (binascii.Error, UnicodeError, ValueError) as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+    if not isinstance(key, list):
+        raise ValueError(f"Invalid cursor: {cursor}")
+    return key
@@ -0,0 +1,110 @@
+# MIT License
+#
+# Copyright (c) 2023 MEng-Team-Project
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+"""Serving the microservice with a production WSGI server. Multiple worker
+processes require gunicorn (POSIX only), multiple threads in a single
+process use waitress if gunicorn isn't installed. Otherwise the app is run
+by Flask's development server."""
+
+import logging
+
+try:
+    import gunicorn.app.base
+except ImportError:
+    gunicorn = None
+
+try:
+    import waitress
+except ImportError:
+    waitress = None
+
+def choose_server(workers=1, threads=1):
+    """Pick the installed server for the requested number of worker
+    processes and threads per worker. Returns `gunicorn`, `waitress` or
+    `flask`."""
+    if workers <= 1 and threads <= 1:
+        return "flask"
+    if gunicorn is not None:
+        return "gunicorn"
+    if waitress is not None:
+        if workers > 1:
+            logging.warning(
+                "gunicorn is not installed, serving %d threads from a single process "
+                "instead of %d worker processes", workers * threads, workers)
+        return "waitress"
+    logging.warning("Neither gunicorn nor waitress is installed, using Flask's development server")
+    return "flask"
+
+if gunicorn is not None:
+    class PreloadedApplication(gunicorn.app.base.BaseApplication):
+        """gunicorn application which loads (and preloads) the WSGI app in
+        the master process, so the worker processes are forked with its
+        warmed caches."""
+
+        def __init__(self, app, options, preload=None):
+            self.app     = app
+            self.options = options
+            self.preload = preload
+            super(PreloadedApplication, self).__init__()
+
+        def load_config(self):
+            for key, value in self.options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            if self.preload is not None:
+                self.preload()
+            return self.app
+
+def serve(app, host, port, workers=1, threads=1, preload=None, timeout=300):
+    """Serve a WSGI app until interrupted.
+
+    args:
+        app     - Flask (WSGI) app
+        host    - Host IP
+        port    - Host port
+        workers - Number of worker processes
+        threads - Number of threads per worker process
+        preload - (Optional) Function run once before serving, before
+                  worker processes are forked, e.g. to warm caches
+        timeout - Seconds a gunicorn worker may spend on a request before
+                  it is restarted
+    """
+    server = choose_server(workers, threads)
+    logging.info("Serving on %s:%d with %s (%d workers, %d threads)",
+                 host, port, server, workers, threads)
+    if server == "gunicorn":
+        options = {
+            "bind":        f"{host}:{port}",
+            "workers":     workers,
+            "threads":     threads,
+            "preload_app": True,
+            "timeout":     timeout
+        }
+        PreloadedApplication(app, options, preload).run()
+        return
+
+    if preload is not None:
+        preload()
+    if server == "waitress":
+        waitress.serve(app, host=host, port=port, threads=workers * threads)
+    else:
+        app.run(host=host, port=port)
@@ -0,0 +1,160 @@
+# MIT License
+#
+# Copyright (c) 2023 MEng-Team-Project
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+"""Columnar sidecars of analysis database detection tables. Each column is
+saved as a `.npy` file in a `{stream}.columns` directory next to
+`{stream}.db`, along with a manifest, so that the table can be loaded with
+memory-mapped arrays instead of being converted row by row by
+`pd.read_sql_query`. Processes loading the same sidecar share its pages
+through the OS page cache.
+
+String columns (the class labels) are dictionary encoded as int32 codes
+into the manifest's categories, with -1 for missing values."""
+
+import json
+import logging
+import os
+import shutil
+import sqlite3
+import tempfile
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from traffic_ml.lib.db import connect_read_only, read_detections, detection_watermark, \
+    appended_since, watermark_rowid
+
+SIDECAR_VERSION = 1
+MANIFEST_NAME   = "manifest.json"
+
+def sidecar_path(analysis_path):
+    """Directory of the sidecar of an analysis database."""
+    analysis_path = Path(analysis_path)
+    return analysis_path.with_name(f"{analysis_path.stem}.columns")
+
+def encode_column(values):
+    """Encode a detection column as an array which can be saved without
+    pickle, and its manifest entry. Returns None if the column can't be
+    encoded."""
+    if values.dtype != object:
+        return values.to_numpy(), {"name": values.name}
+    codes, categories = pd.factorize(values)
+    if not all(isinstance(category, str) for category in categories):
+        return None
+    return codes.astype(np.int32), {"name": values.name, "categories": list(categories)}
+
+def decode_column(array, entry):
+    """Inverse of `encode_column`. Numeric columns are kept memory-mapped."""
+    if "categories" not in entry:
+        return array
+    return np.asarray(entry["categories"] + [None], dtype=object)[array]
+
+def write_sidecar(analysis_path):
+    """(Re)write the sidecar of an analysis database from its full detection
+    table. Like `db.build_tracks` this should be run once the tracker has
+    finished writing detections. The sidecar is written to a temporary
+    directory and moved into place, so readers never see a partial one.
+    Returns the number of rows written, or None if it could not be written."""
+    analysis_path = Path(analysis_path)
+    path = sidecar_path(analysis_path)
+    try:
+        con = connect_read_only(analysis_path)
+        try:
+            watermark     = detection_watermark(con)
+            detections_df = read_detections(con, until=watermark_rowid(watermark))
+        finally:
+            con.close()
+
+        columns = []
+        tmp_dir = Path(tempfile.mkdtemp(prefix=f".{path.name}.", dir=path.parent))
+        try:
+            for col in detections_df.columns:
+                encoded = encode_column(detections_df[col])
+                if encoded is None:
+                    raise ValueError(f"Column {col} has non-string values")
+                array, entry = encoded
+                entry["file"] = f"{col}.npy"
+                np.save(tmp_dir / entry["file"], array, allow_pickle=False)
+                columns.append(entry)
+            manifest = {
+                "version":   SIDECAR_VERSION,
+                "rows":      len(detections_df),
+                "watermark": None if watermark is None else list(watermark),
+                "columns":   columns
+            }
+            with open(tmp_dir / MANIFEST_NAME, "w") as f:
+                json.dump(manifest, f)
+
+            # Directories can't be replaced in one rename, so the old
+            # sidecar is moved aside first
+            old_dir = None
+            if path.exists():
+                old_dir = Path(tempfile.mkdtemp(prefix=f".{path.name}.old.", dir=path.parent))
+                os.rename(path, old_dir / path.name)
+            os.rename(tmp_dir, path)
+            if old_dir is not None:
+                shutil.rmtree(old_dir, ignore_errors=True)
+        except BaseException:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+    except (sqlite3.Error, OSError, ValueError) as e:
+        logging.warning("Could not write sidecar of %s: %s", analysis_path, e)
+        return None
+    return len(detections_df)
+
+def read_sidecar(analysis_path, con):
+    """Load the detection table of an analysis database from its sidecar,
+    with numeric columns memory-mapped read-only.
+
+    args:
+        analysis_path - Path of the analysis database
+        con           - Connection to the database, used to check the
+                        sidecar's watermark is still in place
+    returns:
+        (detections_df, watermark) - Detections up to and including the
+                                     sidecar's watermark, or None if there
+                                     is no sidecar or the database has been
+                                     rewritten since it was written"""
+    path = sidecar_path(analysis_path)
+    try:
+        with open(path / MANIFEST_NAME) as f:
+            manifest = json.load(f)
+        if manifest.get("version") != SIDECAR_VERSION:
+            return None
+        watermark = manifest["watermark"]
+        watermark = None if watermark is None else tuple(watermark)
+        if not appended_since(con, watermark):
+            return None
+
+        columns = {}
+        for entry in manifest["columns"]:
+            array = np.load(path / entry["file"], mmap_mode="r", allow_pickle=False)
+            if len(array) != manifest["rows"]:
+                return None
+            columns[entry["name"]] = decode_column(array, entry)
+    except (OSError, ValueError, KeyError) as e:
+        if not isinstance(e, FileNotFoundError):
+            logging.warning("Could not read sidecar of %s: %s", analysis_path, e)
+        return None
+    # Passed as a dict with copy=False so numeric columns aren't
+    # consolidated into new (private) blocks
+    return pd.DataFrame(columns, copy=False), watermark
@@ -0,0 +1,210 @@
+# MIT License
+#
+# Copyright (c) 2023 MEng-Team-Project
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+"""Vectorized helpers for turning per-frame detections into per-track
+trajectories. A track is identified by its `(label, det_id)` tuple."""
+
+import numpy as np
+import pandas as pd
+
+TRACK_KEYS = ["label", "det_id"]
+
+def add_anchors(detections_df):
+    """Copy of a detection table with the anchor (centre) point of each
+    bounding box in the `anchor_x` and `anchor_y` columns."""
+    routes_df = detections_df.copy()
+    routes_df["anchor_x"] = routes_df["bbox_x"] + routes_df["bbox_w"] / 2.0
+    routes_df["anchor_y"] = routes_df["bbox_y"] + routes_df["bbox_h"] / 2.0
+    return routes_df
+
+def sort_tracks(routes_df):
+    """Sort detections by track, in the same order as `groupby(TRACK_KEYS)`.
+    The sort is stable so each track's points keep their original order.
+    Detections with a missing label or det_id are dropped, as in groupby."""
+    routes_df = routes_df.dropna(subset=TRACK_KEYS)
+    return routes_df.sort_values(TRACK_KEYS, kind="mergesort")
+
+def track_offsets(sorted_df):
+    """Offsets of the first row of each track in a `sort_tracks` table,
+    with the number of rows appended, so track `i` is the row slice
+    `offsets[i]:offsets[i + 1]`."""
+    n = len(sorted_df)
+    if n == 0:
+        return np.zeros(1, dtype=np.int64)
+    labels  = sorted_df["label"].to_numpy()
+    det_ids = sorted_df["det_id"].to_numpy()
+    changed = (labels[1:] != labels[:-1]) | (det_ids[1:] != det_ids[:-1])
+    return np.concatenate(([0], np.flatnonzero(changed) + 1, [n]))
+
+def track_endpoints(routes_df, time_col="frame"):
+    """Get the first and last anchor point of each track.
+
+    args:
+        routes_df - Detections with anchor points, see `add_anchors`
+        time_col  - Column with the time of each detection
+    returns:
+        DataFrame with one row per track, sorted by track, with the columns
+        label, det_id, start_{time_col}, start_x, start_y,
+        end_{time_col}, end_x, end_y and n_points"""
+    sorted_df = sort_tracks(routes_df)
+    offsets   = track_offsets(sorted_df)
+    first     = offsets[:-1]
+    last      = offsets[1:] - 1
+
+    endpoints = {}
+    for col in TRACK_KEYS:
+        endpoints[col] = sorted_df[col].to_numpy()[first]
+    for prefix, rows in (("start", first), ("end", last)):
+        endpoints[f"{prefix}_{time_col}"] = sorted_df[time_col].to_numpy()[rows]
+        endpoints[f"{prefix}_x"] = sorted_df["anchor_x"].to_numpy()[rows]
+        endpoints[f"{prefix}_y"] = sorted_df["anchor_y"].to_numpy()[rows]
+    endpoints["n_points"] = np.diff(offsets)
+    return pd.DataFrame(endpoints, columns=
+        TRACK_KEYS + [f"start_{time_col}", "start_x", "start_y",
+                      f"end_{time_col}", "end_x", "end_y", "n_points"])
+
+def merge_endpoints(endpoints_df, new_df):
+    """Combine the endpoints of the same tracks over two consecutive runs
+    of detections, e.g. the endpoints of previously read detections with
+    the endpoints of detections written since.
+
+    args:
+        endpoints_df - Track endpoints of the earlier detections
+        new_df       - Track endpoints of the later detections
+    returns:
+        Track endpoints of all detections, sorted by track. Tracks start at
+        their first point in `endpoints_df` and end at their last point in
+        `new_df`, and the number of points is summed"""
+    if len(new_df) == 0:
+        return endpoints_df
+    if len(endpoints_df) == 0:
+        return new_df
+
+    # The stable sort keeps each track's earlier endpoints first
+    merged_df = sort_tracks(pd.concat([endpoints_df, new_df], ignore_index=True))
+    offsets   = track_offsets(merged_df)
+    first     = offsets[:-1]
+    last      = offsets[1:] - 1
+
+    merged = {}
+    for col in merged_df.columns:
+        rows = last if col.startswith("end_") else first
+        merged[col] = merged_df[col].to_numpy()[rows]
+    merged["n_points"] = np.add.reduceat(merged_df["n_points"].to_numpy(), first)
+    return pd.DataFrame(merged, columns=merged_df.columns)
+
+def page_order(endpoints_df, time_col="frame"):
+    """Sort track endpoints by start time, for paging with `endpoint_page`.
+    Ties are broken by det_id and then label."""
+    key_cols = [f"start_{time_col}", "det_id", "label"]
+    return endpoints_df.sort_values(key_cols, kind="mergesort").reset_index(drop=True)
+
+def endpoint_page(endpoints_df, key=None, limit=1000, time_col="frame"):
+    """Get a page of tracks ordered by their start time, using the
+    `(start_{time_col}, det_id, label)` key of the last track of the
+    previous page rather than an offset. The page is found by binary
+    search, so endpoints can be sorted once and paged many times.
+
+    args:
+        endpoints_df - Track endpoints sorted by `page_order`
+        key          - (Optional) Key of the last track of the previous page
+        limit        - Maximum number of tracks in the page
+    returns:
+        (page_df, next_key) - Endpoints of the tracks in the page and the
+                              key of its last track, or None if this is the
+                              last page"""
+    key_cols = [f"start_{time_col}", "det_id", "label"]
+    first    = 0
+    if key is not None:
+        start, det_id, label = key
+        starts = endpoints_df[key_cols[0]].to_numpy()
+        first  = np.searchsorted(starts, start, side="left")
+        last   = np.searchsorted(starts, start, side="right")
+        # Only the tracks starting at the same time are compared in full
+        ties   = endpoints_df.iloc[first:last]
+        after  = ((ties["det_id"] > det_id) |
+                  ((ties["det_id"] == det_id) & (ties["label"] > label))).to_numpy()
+        first  = first + int(np.argmax(after)) if after.any() else last
+
+    data     = endpoints_df.iloc[first:first + limit]
+    next_key = None
+    if first + limit < len(endpoints_df):
+        next_key = data[key_cols].iloc[-1].tolist()
+    return data, next_key
+
+def track_points(routes_df, columns, first_last=False):
+    """Get the points of each track as lists of values.
+
+    args:
+        routes_df  - Detections with anchor points, see `add_anchors`
+        columns    - Columns making up each point, e.g. frame and anchor
+        first_last - Only include the first and last point of each track
+    returns:
+        Series of `[[col_0, col_1, ...], ...]` lists indexed by track"""
+    sorted_df = sort_tracks(routes_df)
+    offsets   = track_offsets(sorted_df)
+    index     = pd.MultiIndex.from_arrays(
+        [sorted_df[col].to_numpy()[offsets[:-1]] for col in TRACK_KEYS],
+        names=TRACK_KEYS)
+
+    if first_last:
+        rows = np.stack((offsets[:-1], offsets[1:] - 1), axis=1).ravel()
+        points  = sorted_df[columns].to_numpy()[rows].tolist()
+        offsets = np.arange(0, len(rows) + 1, 2)
+    else:
+        points  = sorted_df[columns].to_numpy().tolist()
+
+    return pd.Series(
+        [points[a:b] for a, b in zip(offsets[:-1], offsets[1:])],
+        index=index, dtype=object)
+
+def routes_by_label(routes_df, trk_fmt="first_last"):
+    """Group the frame and anchor points of each track by class label.
+
+    args:
+        routes_df - Detections with anchor points, see `add_anchors`
+        trk_fmt   - Either `first_last` or `entire` points of each track
+    returns:
+        `{label: [[{"frame:": frame, "x": x, "y": y}, ...], ...]}`"""
+    points = track_points(
+        routes_df, ["frame", "anchor_x", "anchor_y"],
+        first_last=trk_fmt == "first_last")
+
+    return _group_routes(points.index.get_level_values("label"), points)
+
+def endpoint_routes_by_label(endpoints_df):
+    """`routes_by_label` in the `first_last` format, from the first and last
+    points of each track, see `track_endpoints`.
+
+    args:
+        endpoints_df - Track endpoints with frame times, sorted by track
+    returns:
+        `{label: [[{"frame:": frame, "x": x, "y": y}, ...], ...]}`"""
+    starts = endpoints_df[["start_frame", "start_x", "start_y"]].to_numpy().tolist()
+    ends   = endpoints_df[["end_frame",   "end_x",   "end_y"]].to_numpy().tolist()
+    return _group_routes(endpoints_df["label"], list(zip(starts, ends)))
+
+def _group_routes(labels, routes):
+    route_dict = {}
+    for label, route in zip(labels, routes):
+        route_dict.setdefault(label, []).append(
+            [{"frame:": frame, "x": x, "y": y} for frame, x, y in route])
+    return route_dict
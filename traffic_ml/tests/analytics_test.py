@@ -0,0 +1,94 @@
+# MIT License
+# 
+# Copyright (c) 2023 MEng-Team-Project
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+"""Route analytics interval assignment testing."""
+
+import arrow
+import numpy as np
+import pandas as pd
+from absl.testing import absltest
+
+from traffic_ml.tests import utils
+from traffic_ml.lib.analytics import \
+    arrow_to_us, us_to_arrow, frames_to_us, assign_intervals, route_counts
+
+
+class TestTimes(utils.TestCase):
+    def test_frames_match_arrow_shift(self):
+        start  = arrow.get(1674201600.123456)
+        frames = np.arange(0, 100000, 37)
+        for fps in (30, 29.97, 25):
+            expected = arrow_to_us(
+                [start.shift(microseconds=1000000/fps * int(f)) for f in frames])
+            np.testing.assert_array_equal(
+                frames_to_us(frames, arrow_to_us([start])[0], fps), expected)
+
+    def test_round_trip(self):
+        time = arrow.get(1674201600.654321)
+        self.assertEqual(us_to_arrow(arrow_to_us([time])[0]), time)
+
+
+class TestAssignIntervals(utils.TestCase):
+    def setUp(self):
+        super(TestAssignIntervals, self).setUp()
+        self.floors = np.array([0, 10, 20])
+        self.ceils  = np.array([9, 19, 29])
+
+    def test_start_interval(self):
+        idx = assign_intervals([0, 9, 12, 29], [1, 9, 15, 29],
+                               self.floors, self.ceils)
+        np.testing.assert_array_equal(idx, [0, 0, 1, 2])
+
+    def test_moves_to_next_interval(self):
+        # 8 -> 30 spends longer after the first interval than in it
+        idx = assign_intervals([2, 8], [11, 30], self.floors, self.ceils)
+        np.testing.assert_array_equal(idx, [0, 1])
+
+    def test_last_interval_is_clamped(self):
+        idx = assign_intervals([28], [100], self.floors, self.ceils)
+        np.testing.assert_array_equal(idx, [2])
+
+    def test_outside_intervals(self):
+        idx = assign_intervals([-5, 30], [1, 31], self.floors, self.ceils)
+        np.testing.assert_array_equal(idx, [-1, -1])
+        idx = assign_intervals([-5, 30], [1, 31], self.floors, self.ceils,
+                               include_earlier=True)
+        np.testing.assert_array_equal(idx, [0, -1])
+
+
+class TestRouteCounts(utils.TestCase):
+    def test_counts(self):
+        df = pd.DataFrame({
+            'interval':     [0, 0, 0, 1, 0, 2, -1, 2],
+            'start_region': ['a', 'b', 'a', 'a', 'a', 'a', 'a', np.nan],
+            'end_region':   ['b', 'a', 'b', 'b', 'a', 'c', 'b', 'b'],
+            'label':        ['car', 'bus', 'bus', 'car', 'car', 'car', 'car', 'car']
+        })
+        counts = route_counts(df, ['a', 'b'], ['a', 'b'])
+        self.assertEqual(counts, {
+            0: [{'start': 'a', 'end': 'b', 'counts': {'total': 2, 'car': 1, 'bus': 1}},
+                {'start': 'b', 'end': 'a', 'counts': {'total': 1, 'bus': 1}}],
+            1: [{'start': 'a', 'end': 'b', 'counts': {'total': 1, 'car': 1}}]
+        })
+
+
+if __name__ == "__main__":
+    absltest.main()
@@ -0,0 +1,135 @@
+# MIT License
+# 
+# Copyright (c) 2023 MEng-Team-Project
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+"""Shared stream cache testing."""
+
+import os
+import tempfile
+
+from absl.testing import absltest
+
+from traffic_ml.tests import utils
+from traffic_ml.lib.cache import LRUCache, StreamCache, content_hash
+
+
+class TestContentHash(utils.TestCase):
+    def test_field_order(self):
+        self.assertEqual(content_hash({"stream": "a", "classes": ["car"]}),
+                         content_hash({"classes": ["car"], "stream": "a"}))
+
+    def test_nested_order(self):
+        self.assertNotEqual(content_hash({"regions": {"a": [], "b": []}}),
+                            content_hash({"regions": {"b": [], "a": []}}))
+
+
+class TestLRUCache(utils.TestCase):
+    def test_evicts_least_recently_used(self):
+        cache = LRUCache(max_bytes=10, sizeof=lambda value: value)
+        cache.put("a", 4)
+        cache.put("b", 4)
+        cache.get("a")
+        cache.put("c", 4)
+        self.assertIn("a", cache)
+        self.assertNotIn("b", cache)
+        self.assertEqual(cache.stats()["evictions"], 1)
+
+    def test_oversized_values_are_not_stored(self):
+        cache = LRUCache(max_bytes=10, sizeof=lambda value: value)
+        self.assertFalse(cache.put("a", 11))
+        self.assertEqual(len(cache), 0)
+
+    def test_hit_and_miss_stats(self):
+        cache = LRUCache(max_bytes=10, sizeof=lambda value: 1)
+        cache.get("a")
+        cache.put("a", "value")
+        cache.get("a")
+        stats = cache.stats()
+        self.assertEqual(stats["hits"], 1)
+        self.assertEqual(stats["misses"], 1)
+
+    def test_peek_keeps_invalid_entries(self):
+        cache = LRUCache(max_bytes=10, sizeof=lambda value: 1)
+        cache.put("a", 1)
+        self.assertIsNone(cache.peek("a", valid=lambda value: value == 2))
+        self.assertIsNone(cache.peek("b"))
+        self.assertEqual(cache.peek("a"), 1)
+        self.assertEqual(cache.stats()["hits"], 1)
+        self.assertEqual(cache.stats()["misses"], 0)
+
+    def test_remove_where(self):
+        cache = LRUCache(max_bytes=10, sizeof=lambda value: 1)
+        for key in [("a", 1), ("a", 2), ("b", 1)]:
+            cache.put(key, 1)
+        self.assertEqual(cache.remove_where(lambda key: key[0] == "a"), 2)
+        self.assertEqual(len(cache), 1)
+        self.assertEqual(cache.stats()["bytes"], 1)
+
+
+class TestStreamCache(utils.TestCase):
+    def setUp(self):
+        super(TestStreamCache, self).setUp()
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path    = os.path.join(self.tmp_dir.name, "stream.db")
+        self.loads   = 0
+        with open(self.path, "w") as f:
+            f.write("v1")
+
+    def tearDown(self):
+        super(TestStreamCache, self).tearDown()
+        self.tmp_dir.cleanup()
+
+    def load(self, path):
+        self.loads += 1
+        with open(path) as f:
+            return f.read()
+
+    def test_reloads_when_database_changes(self):
+        cache = StreamCache(1024, self.load)
+        self.assertEqual(cache.get("stream", self.path), "v1")
+        self.assertEqual(cache.get("stream", self.path), "v1")
+        self.assertEqual(self.loads, 1)
+
+        with open(self.path, "w") as f:
+            f.write("v2 (grown)")
+        self.assertEqual(cache.get("stream", self.path), "v2 (grown)")
+        self.assertEqual(self.loads, 2)
+        self.assertEqual(cache.stats()["misses"], 2)
+
+    def test_extends_when_database_changes(self):
+        def extend(path, value):
+            with open(path) as f:
+                return value + f.read()[len(value):]
+        cache = StreamCache(1024, self.load, extend)
+        cache.get("stream", self.path)
+        with open(self.path, "a") as f:
+            f.write(", v2")
+        self.assertEqual(cache.get("stream", self.path), "v1, v2")
+        self.assertEqual(self.loads, 1)
+        self.assertEqual(cache.stats()["extensions"], 1)
+
+    def test_missing_database(self):
+        cache = StreamCache(1024, self.load)
+        with self.assertRaises(FileNotFoundError):
+            cache.get("missing", os.path.join(self.tmp_dir.name, "missing.db"))
+
+
+if __name__ == "__main__":
+    absltest.main()
@@ -0,0 +1,208 @@
+# MIT License
+# 
+# Copyright (c) 2023 MEng-Team-Project
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+"""Analysis database helpers testing."""
+
+import os
+import sqlite3
+import tempfile
+
+import pandas as pd
+from absl.testing import absltest
+
+from traffic_ml.tests import utils
+from traffic_ml.lib.db import detection_filter, read_detections, filter_detections, \
+    summarise_tracks, build_tracks, read_tracks, detection_watermark, appended_since, \
+    read_detection_page, read_track_detections, ConnectionPool
+from traffic_ml.lib.trajectory import add_anchors, track_endpoints, merge_endpoints
+
+DETECTIONS = pd.DataFrame({
+    "frame":  [1, 1, 2, 3, 3, 4],
+    "label":  ["car", "bus", "car", "car", "person", "bus"],
+    "det_id": [0.0, 1.0, 0.0, 0.0, 2.0, 1.0],
+    "bbox_x": [10.0, 20.0, 12.0, 14.0, 30.0, 22.0],
+    "bbox_y": [5.0, 5.0, 6.0, 7.0, 8.0, 9.0],
+    "bbox_w": [2.0, 2.0, 2.0, 2.0, 2.0, 2.0],
+    "bbox_h": [2.0, 2.0, 2.0, 2.0, 2.0, 2.0]
+})
+
+
+class TestDetectionFilter(utils.TestCase):
+    def test_unfiltered(self):
+        self.assertEqual(detection_filter(), ("", []))
+
+    def test_frame_range_and_classes(self):
+        where, params = detection_filter(2, 3, ["car", "bus"])
+        self.assertEqual(where, " WHERE frame BETWEEN ? AND ? AND label IN (?, ?)")
+        self.assertEqual(params, [2, 3, "car", "bus"])
+
+    def test_pushdown_matches_in_memory_filter(self):
+        con = sqlite3.connect(":memory:")
+        DETECTIONS.to_sql("detection", con, index=False)
+        for start, end, classes in [(None, None, None), (2, None, None),
+                                    (None, 3, ["car"]), (1, 3, ["bus", "person"])]:
+            expected = filter_detections(DETECTIONS, start, end, classes)
+            actual   = read_detections(con, start, end, classes)
+            pd.testing.assert_frame_equal(
+                actual, expected.reset_index(drop=True), check_dtype=False)
+        con.close()
+
+
+class TestPages(utils.TestCase):
+    def setUp(self):
+        super(TestPages, self).setUp()
+        self.con = sqlite3.connect(":memory:")
+        DETECTIONS.to_sql("detection", self.con, index=False)
+
+    def tearDown(self):
+        self.con.close()
+        super(TestPages, self).tearDown()
+
+    def test_pages_cover_detections(self):
+        pages, key = [], None
+        while True:
+            page_df, key = read_detection_page(self.con, classes=["car", "bus"], key=key, limit=2)
+            pages.append(page_df)
+            if key is None:
+                break
+        self.assertEqual([len(page_df) for page_df in pages], [2, 2, 1])
+        rows = pd.concat(pages)
+        self.assertEqual(list(zip(rows["frame"], rows["det_id"])),
+                         [(1, 0.0), (1, 1.0), (2, 0.0), (3, 0.0), (4, 1.0)])
+
+    def test_track_detections(self):
+        tracks_df = read_track_detections(self.con, [("car", 0.0), ("person", 2.0)], start=2)
+        self.assertEqual(tracks_df["frame"].tolist(), [2, 3, 3])
+        self.assertEqual(len(read_track_detections(self.con, [])), 0)
+
+
+class TestTracks(utils.TestCase):
+    def setUp(self):
+        super(TestTracks, self).setUp()
+        self.tmp  = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "stream.db")
+        con = sqlite3.connect(self.path)
+        DETECTIONS.to_sql("detection", con, index=False)
+        con.close()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+        super(TestTracks, self).tearDown()
+
+    def test_missing(self):
+        con = sqlite3.connect(self.path)
+        self.assertIsNone(read_tracks(con))
+        con.close()
+
+    def test_summary_matches_endpoints(self):
+        con = sqlite3.connect(self.path)
+        pd.testing.assert_frame_equal(
+            summarise_tracks(con), track_endpoints(add_anchors(DETECTIONS)),
+            check_dtype=False)
+        con.close()
+
+    def test_build_and_read(self):
+        self.assertEqual(build_tracks(self.path), 3)
+        con = sqlite3.connect(self.path)
+        tracks_df, rowid = read_tracks(con)
+        pd.testing.assert_frame_equal(tracks_df, summarise_tracks(con))
+        self.assertEqual(rowid, len(DETECTIONS))
+        con.close()
+
+    def test_appended_detections(self):
+        con = sqlite3.connect(self.path)
+        watermark = detection_watermark(con)
+        self.assertEqual(watermark, (6, 4, "bus", 1.0))
+        DETECTIONS.iloc[:2].to_sql("detection", con, index=False, if_exists="append")
+        self.assertTrue(appended_since(con, watermark))
+        self.assertEqual(len(read_detections(con, after=watermark[0])), 2)
+
+        # Adding the tracks of appended detections is the same as
+        # summarising all detections
+        pd.testing.assert_frame_equal(
+            merge_endpoints(summarise_tracks(con, until=watermark[0]),
+                            summarise_tracks(con, after=watermark[0])),
+            summarise_tracks(con))
+
+        con.execute("DELETE FROM detection;")
+        self.assertFalse(appended_since(con, watermark))
+        con.close()
+
+
+class TestConnectionPool(utils.TestCase):
+    def setUp(self):
+        super(TestConnectionPool, self).setUp()
+        self.tmp   = tempfile.TemporaryDirectory()
+        self.paths = []
+        for name in ["a", "b"]:
+            path = os.path.join(self.tmp.name, f"{name}.db")
+            con  = sqlite3.connect(path)
+            DETECTIONS.to_sql("detection", con, index=False)
+            con.close()
+            self.paths.append(path)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+        super(TestConnectionPool, self).tearDown()
+
+    def test_reuses_read_only_connections(self):
+        pool = ConnectionPool(max_connections=2)
+        with pool.connection(self.paths[0]) as con:
+            first = con
+            self.assertEqual(len(read_detections(con)), len(DETECTIONS))
+            with self.assertRaises(sqlite3.OperationalError):
+                con.execute("DELETE FROM detection;")
+        with pool.connection(self.paths[0]) as con:
+            self.assertIs(con, first)
+        self.assertEqual(pool.stats()["hits"], 1)
+        pool.close()
+        self.assertEqual(pool.stats()["open"], 0)
+
+    def test_caps_open_connections(self):
+        pool = ConnectionPool(max_connections=1, timeout=0.1)
+        with pool.connection(self.paths[0]):
+            with self.assertRaises(sqlite3.OperationalError):
+                with pool.connection(self.paths[1]):
+                    pass
+        # The idle connection to the first database makes room
+        with pool.connection(self.paths[1]) as con:
+            self.assertEqual(len(read_detections(con)), len(DETECTIONS))
+        self.assertEqual(pool.stats()["open"], 1)
+
+    def test_replaced_database(self):
+        pool = ConnectionPool()
+        with pool.connection(self.paths[0]) as con:
+            pass
+        os.replace(self.paths[1], self.paths[0])
+        with pool.connection(self.paths[0]) as con:
+            self.assertEqual(len(read_detections(con)), len(DETECTIONS))
+        self.assertEqual(pool.stats()["open"], 1)
+
+    def test_missing_database(self):
+        pool = ConnectionPool()
+        with self.assertRaises(FileNotFoundError):
+            with pool.connection(os.path.join(self.tmp.name, "missing.db")):
+                pass
+        self.assertFalse(os.path.exists(os.path.join(self.tmp.name, "missing.db")))
+
+
+if __name__ == "__main__":
+    absltest.main()
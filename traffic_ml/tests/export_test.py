@@ -0,0 +1,65 @@
+# MIT License
+# 
+# Copyright (c) 2023 MEng-Team-Project
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+"""Binary columnar export testing."""
+
+import io
+import unittest
+
+import numpy as np
+import pandas as pd
+from absl.testing import absltest
+
+from traffic_ml.tests import utils
+from traffic_ml.lib import export
+from traffic_ml.lib.export import available_formats, export_table
+
+DETECTIONS = pd.DataFrame({
+    "frame":  [1, 1, 2],
+    "label":  ["car", None, "bus"],
+    "det_id": [0.0, 1.0, np.nan],
+    "bbox_x": [10.0, 20.0, 12.0]
+})
+
+
+class TestExport(utils.TestCase):
+    def test_npz(self):
+        archive = np.load(io.BytesIO(export_table(DETECTIONS, "npz")))
+        self.assertEqual(archive.files, list(DETECTIONS.columns))
+        np.testing.assert_array_equal(archive["frame"], DETECTIONS["frame"])
+        np.testing.assert_array_equal(archive["det_id"], DETECTIONS["det_id"])
+        self.assertEqual(archive["label"].tolist(), ["car", "", "bus"])
+
+    def test_unsupported_format(self):
+        with self.assertRaises(ValueError):
+            export_table(DETECTIONS, "csv")
+
+    @unittest.skipIf(export.pa is None, "pyarrow is not installed")
+    def test_arrow_and_parquet(self):
+        self.assertEqual(available_formats(), ["arrow", "parquet", "npz"])
+        arrow = export.pa.ipc.open_file(export_table(DETECTIONS, "arrow")).read_pandas()
+        pd.testing.assert_frame_equal(arrow, DETECTIONS)
+        parquet = pd.read_parquet(io.BytesIO(export_table(DETECTIONS, "parquet")))
+        pd.testing.assert_frame_equal(parquet, DETECTIONS)
+
+
+if __name__ == "__main__":
+    absltest.main()
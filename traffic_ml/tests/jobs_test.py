@@ -0,0 +1,79 @@
+# MIT License
+# 
+# Copyright (c) 2023 MEng-Team-Project
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+"""Background job queue testing."""
+
+import sys
+import time
+
+from absl.testing import absltest
+
+from traffic_ml.tests import utils
+from traffic_ml.lib.jobs import JobQueue, SUCCEEDED, FAILED
+
+PROGRESS_SCRIPT = "import sys\nfor i in range(1, 5): print(f'frame ({i}/4)', end='\\r')"
+
+
+def wait(job, timeout=10.0):
+    deadline = time.time() + timeout
+    while not job.done and time.time() < deadline:
+        time.sleep(0.01)
+
+
+class TestJobQueue(utils.TestCase):
+    def setUp(self):
+        super(TestJobQueue, self).setUp()
+        self.queue = JobQueue(max_workers=2)
+
+    def tearDown(self):
+        self.queue.shutdown()
+        super(TestJobQueue, self).tearDown()
+
+    def test_success(self):
+        finished = []
+        job = self.queue.submit(
+            [sys.executable, "-c", PROGRESS_SCRIPT],
+            on_success=finished.append, info={"stream": "clip"})
+        wait(job)
+        status = job.to_dict()
+        self.assertEqual(status["state"], SUCCEEDED)
+        self.assertEqual(status["progress"], 1.0)
+        self.assertEqual(status["returncode"], 0)
+        self.assertEqual(status["stream"], "clip")
+        self.assertGreaterEqual(status["wall_time"], 0.0)
+        self.assertEqual(finished, [job])
+        self.assertIs(self.queue.get(job.id), job)
+
+    def test_failure(self):
+        job = self.queue.submit([sys.executable, "-c", "raise SystemExit(3)"])
+        wait(job)
+        self.assertEqual(job.state, FAILED)
+        self.assertEqual(job.returncode, 3)
+
+    def test_missing_executable(self):
+        job = self.queue.submit(["/nonexistent/executable"])
+        wait(job)
+        self.assertEqual(job.state, FAILED)
+        self.assertIsNone(job.returncode)
+
+
+if __name__ == "__main__":
+    absltest.main()
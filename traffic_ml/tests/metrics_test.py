@@ -0,0 +1,63 @@
+# MIT License
+# 
+# Copyright (c) 2023 MEng-Team-Project
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+"""Prometheus metrics testing."""
+
+from absl.testing import absltest
+
+from traffic_ml.tests import utils
+from traffic_ml.lib.metrics import Registry
+
+
+class TestMetrics(utils.TestCase):
+    def setUp(self):
+        super(TestMetrics, self).setUp()
+        self.registry = Registry()
+
+    def test_counter(self):
+        rows = self.registry.counter("rows_total", "Rows.", ["stage"])
+        rows.inc(10, stage="load")
+        rows.inc(5, stage="load")
+        self.assertEqual(rows.value(stage="load"), 15)
+        self.assertIn('rows_total{stage="load"} 15', self.registry.render())
+        with self.assertRaises(ValueError):
+            rows.inc(stage="load", endpoint="routes")
+
+    def test_histogram_buckets_are_cumulative(self):
+        seconds = self.registry.histogram("seconds", "Latency.", ["stage"], buckets=[0.1, 1.0])
+        for value in [0.05, 0.5, 0.5, 5.0]:
+            seconds.observe(value, stage="load")
+        lines = self.registry.render().splitlines()
+        self.assertIn("# TYPE seconds histogram", lines)
+        self.assertIn('seconds_bucket{stage="load",le="0.1"} 1', lines)
+        self.assertIn('seconds_bucket{stage="load",le="1"} 3', lines)
+        self.assertIn('seconds_bucket{stage="load",le="+Inf"} 4', lines)
+        self.assertIn('seconds_count{stage="load"} 4', lines)
+        self.assertIn('seconds_sum{stage="load"} 6.05', lines)
+
+    def test_collector(self):
+        self.registry.collector(lambda: [
+            ("cache_hits_total", "counter", "Hits.", [({"cache": 'a"b'}, 3)])])
+        self.assertIn('cache_hits_total{cache="a\\"b"} 3', self.registry.render())
+
+
+if __name__ == "__main__":
+    absltest.main()
@@ -0,0 +1,283 @@
+# MIT License
+# 
+# Copyright (c) 2023 MEng-Team-Project
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+"""Microservice endpoint testing."""
+
+import json
+import os
+import sqlite3
+import tempfile
+from pathlib import Path
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+from absl import flags
+from absl.testing import absltest, flagsaver
+
+from traffic_ml.tests import utils
+from traffic_ml.bin import microservice
+from traffic_ml.lib.export import EXPORT_FORMATS
+from traffic_ml.lib.rollup import RouteRollup
+
+FLAGS = flags.FLAGS
+
+# Each track moves in a straight line from its first to its last anchor
+# point, one detection a frame (a second at 1 fps)
+TRACKS = [
+    # label,   det_id, first frame, last frame, first x, last x
+    ("car",    0.0,    0,           60,         5.0,     25.0),
+    ("car",    1.0,    100,         130,        25.0,    5.0),
+    ("bus",    2.0,    30,          90,         5.0,     25.0),
+    ("person", 3.0,    10,          20,         5.0,     5.0)]
+
+REGIONS = {"west": [[0, 0], [10, 0], [10, 10], [0, 10]],
+           "east": [[20, 0], [30, 0], [30, 10], [20, 10]]}
+
+
+def detections(tracks=TRACKS):
+    rows = []
+    for label, det_id, first, last, first_x, last_x in tracks:
+        frames = np.arange(first, last + 1)
+        xs     = np.linspace(first_x, last_x, len(frames))
+        rows.append(pd.DataFrame({
+            "frame": frames, "bbox_x": xs - 1.0, "bbox_y": 4.0, "bbox_w": 2.0, "bbox_h": 2.0,
+            "cls": 0, "label": label, "conf": 0.9, "det_id": det_id}))
+    return pd.concat(rows).sort_values("frame", kind="mergesort")
+
+
+class MicroserviceTestCase(utils.TestCase):
+    """Serves the streams of a temporary analysis directory with the Flask
+    test client."""
+
+    def setUp(self):
+        super(MicroserviceTestCase, self).setUp()
+        # Flags are only parsed when run with absltest
+        if not FLAGS.is_parsed():
+            FLAGS.mark_as_parsed()
+        self.tmp   = tempfile.TemporaryDirectory()
+        self.saved = flagsaver.flagsaver(analysis_dir=self.tmp.name)
+        self.saved.__enter__()
+        self.client = microservice.app.test_client()
+        self.write_stream("stream", detections())
+
+    def tearDown(self):
+        self.saved.__exit__(None, None, None)
+        for cache in [microservice.STREAM_CACHE, microservice.TRACK_CACHE,
+                      microservice.ROLLUP_CACHE, microservice.PAGE_CACHE]:
+            cache.invalidate()
+        microservice.ANALYTICS_CACHE.clear()
+        self.tmp.cleanup()
+        super(MicroserviceTestCase, self).tearDown()
+
+    def write_stream(self, stream, detections_df, if_exists="fail", finish=True):
+        """Write detections of a stream, and index and summarise them as a
+        finished analysis is unless `finish` is False."""
+        path = os.path.join(self.tmp.name, f"{stream}.db")
+        con  = sqlite3.connect(path)
+        detections_df.to_sql("detection", con, index=False, if_exists=if_exists)
+        pd.DataFrame({"fps": [1.0], "width": [32], "height": [12]}).to_sql(
+            "metadata", con, index=False, if_exists="replace")
+        con.close()
+        if finish:
+            microservice.finish_analysis(stream, Path(path))
+
+    def post(self, url, content, **headers):
+        # Encoded here as the test client would sort the fields
+        return self.client.post(url, data=json.dumps(content),
+                                content_type="application/json", headers=headers)
+
+
+class TestAnalysis(MicroserviceTestCase):
+    def test_raw_precision(self):
+        response = self.post("/api/analysis/", {"stream": "stream", "raw": True, "precision": 2})
+        self.assertEqual(response.status_code, 200)
+        self.assertLen(response.get_json()["raw"], len(detections()))
+
+        # Invalid precisions are rejected before the raw detections are
+        # streamed, as they are without them
+        for precision in [16, -1, "x"]:
+            for raw in [True, False]:
+                response = self.post("/api/analysis/", {"stream": "stream", "raw": raw, "precision": precision})
+                self.assertEqual(response.status_code, 400)
+                self.assertIn("precision", response.get_json()[1])
+
+
+class TestAnalysisBatch(MicroserviceTestCase):
+    def setUp(self):
+        super(TestAnalysisBatch, self).setUp()
+        self.write_stream("other", detections([("car",   0.0, 0,  10, 5.0, 25.0),
+                                               ("truck", 1.0, 40, 50, 5.0, 25.0)]))
+
+    def batch(self, content):
+        response = self.post("/api/analysis/batch", content)
+        self.assertEqual(response.status_code, 200)
+        result = response.get_json()
+        counts = lambda counts: {row["label"]: row["count"] for row in counts}
+        return counts(result["counts"]), {
+            stream: counts(data["counts"]) if "counts" in data else data
+            for stream, data in result["streams"].items()}
+
+    def test_summed_counts(self):
+        counts, streams = self.batch({"streams": ["stream", "other"]})
+        self.assertEqual(streams["stream"], {"car": 2, "bus": 1, "person": 1})
+        self.assertEqual(streams["other"], {"car": 1, "truck": 1})
+        self.assertEqual(counts, {"car": 3, "bus": 1, "person": 1, "truck": 1})
+
+    def test_missing_stream(self):
+        counts, streams = self.batch({"streams": ["stream", "missing"]})
+        self.assertIn("error", streams["missing"])
+        self.assertEqual(counts, streams["stream"])
+
+    def test_shared_window(self):
+        counts, streams = self.batch({"streams": ["stream", "other"], "start": 25, "end": 70})
+        self.assertEqual(streams["stream"], {"car": 1, "bus": 1})
+        self.assertEqual(streams["other"], {"truck": 1})
+        self.assertEqual(counts, {"car": 1, "bus": 1, "truck": 1})
+
+
+class TestRouteAnalytics(MicroserviceTestCase):
+    def analytics(self, **fields):
+        """Route counts of each interval by its start and end (seconds),
+        and the bucket size the tracks were counted from."""
+        bucket_sizes, route_times = [], RouteRollup.route_times
+        def record(rollup, *args):
+            route_times_df, bucket_us = route_times(rollup, *args)
+            bucket_sizes.append(bucket_us)
+            return route_times_df, bucket_us
+
+        content = dict({"stream": "stream", "regions": REGIONS, "classes": ["car", "bus"],
+                        "time_of_recording": 0, "start_time": 0}, **fields)
+        with mock.patch.object(RouteRollup, "route_times", record):
+            response = self.post("/api/routeAnalytics/", content)
+        self.assertEqual(response.status_code, 200)
+        counts = {}
+        for period in response.get_json()["countsAtTimes"]:
+            counts[(period["periodFrom"], round(period["periodTo"]))] = {
+                (route["start"], route["end"]): route["counts"] for route in period["routeCounts"]}
+        return counts, bucket_sizes[0]
+
+    def test_aligned_spacing(self):
+        # The bus is counted in the next minute, which it spends more of
+        counts, bucket_us = self.analytics(interval_spacing=60, end_time=179)
+        self.assertEqual(bucket_us, 60 * 1000000)
+        self.assertEqual(counts, {
+            (0, 60):   {("west", "east"): {"total": 1, "car": 1}},
+            (60, 120): {("west", "east"): {"total": 1, "bus": 1},
+                        ("east", "west"): {"total": 1, "car": 1}}})
+
+    def test_unaligned_spacing(self):
+        counts, bucket_us = self.analytics(interval_spacing=45, end_time=179)
+        self.assertIsNone(bucket_us)
+        self.assertEqual(counts, {
+            (0, 45):   {("west", "east"): {"total": 1, "car": 1}},
+            (45, 90):  {("west", "east"): {"total": 1, "bus": 1}},
+            (90, 135): {("east", "west"): {"total": 1, "car": 1}}})
+
+    def test_classes(self):
+        counts, _ = self.analytics(interval_spacing=60, end_time=179, classes=["car", "person"])
+        self.assertEqual(counts, {
+            (0, 60):   {("west", "east"): {"total": 1, "car": 1}},
+            (60, 120): {("east", "west"): {"total": 1, "car": 1}}})
+
+    def test_missing_end_time(self):
+        # Intervals end with the last bus, which is moved into the last one
+        counts, _ = self.analytics(interval_spacing=30, classes=["bus"])
+        self.assertEqual(counts, {(60, 90): {("west", "east"): {"total": 1, "bus": 1}}})
+
+
+class TestIndexes(MicroserviceTestCase):
+    def indexes(self, stream):
+        con = sqlite3.connect(os.path.join(self.tmp.name, f"{stream}.db"))
+        try:
+            return con.execute("SELECT name FROM sqlite_master WHERE type = 'index';").fetchall()
+        finally:
+            con.close()
+
+    def test_only_finished_analyses_are_indexed(self):
+        # Requests don't write to databases the tracker may still be writing
+        self.write_stream("running", detections(), finish=False)
+        for content in [{"stream": "running", "start": 10, "end": 50, "classes": ["car"]},
+                        {"stream": "running", "limit": 2}]:
+            self.assertEqual(self.post("/api/analysis/", content).status_code, 200)
+        self.assertEmpty(self.indexes("running"))
+        self.assertNotEmpty(self.indexes("stream"))
+
+
+class TestConditional(MicroserviceTestCase):
+    ANALYTICS = {"stream": "stream", "regions": REGIONS, "classes": ["car", "bus"],
+                 "time_of_recording": 0, "start_time": 0, "interval_spacing": 60}
+
+    def assert_not_modified(self, url, content, view):
+        """Assert that `content` and the same fields in reverse order get
+        a 304 with the ETag of the first response, without calling `view`."""
+        etag, _ = self.post(url, content).get_etag()
+        self.assertIsNotNone(etag)
+        microservice.ANALYTICS_CACHE.clear()
+        with mock.patch.object(microservice, view, wraps=getattr(microservice, view)) as called:
+            reordered = dict(reversed(list(content.items())))
+            response  = self.post(url, reordered, **{"If-None-Match": f'"{etag}"'})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.get_etag()[0], etag)
+        called.assert_not_called()
+        return etag
+
+    def test_analysis_not_modified(self):
+        self.assert_not_modified("/api/analysis/", {"stream": "stream", "classes": ["car"]}, "get_tracks")
+
+    def test_route_analytics_not_modified(self):
+        self.assert_not_modified("/api/routeAnalytics/", self.ANALYTICS, "get_rollup")
+
+    def test_database_write_changes_etag(self):
+        etag = self.assert_not_modified("/api/routeAnalytics/", self.ANALYTICS, "get_rollup")
+        self.write_stream("stream", detections([("truck", 4.0, 140, 150, 5.0, 25.0)]),
+                          if_exists="append", finish=False)
+        response = self.post("/api/routeAnalytics/", self.ANALYTICS, **{"If-None-Match": f'"{etag}"'})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.get_etag()[0], etag)
+
+    def export(self, mimetype, etag=None):
+        headers = {"Accept": mimetype}
+        if etag is not None:
+            headers["If-None-Match"] = etag
+        return self.post("/api/export/", {"stream": "stream"}, **headers)
+
+    def test_export_varies_by_accept(self):
+        npz, arrow = EXPORT_FORMATS["npz"][0], EXPORT_FORMATS["arrow"][0]
+        response = self.export(npz)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("Accept", response.vary)
+        etag, _ = response.get_etag()
+
+        response = self.export(npz, f'"{etag}"')
+        self.assertEqual(response.status_code, 304)
+        self.assertIn("Accept", response.vary)
+
+        # The same export requested in another format isn't a match
+        response = self.export(arrow, f'"{etag}"')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.get_etag()[0], etag)
+
+
+if __name__ == "__main__":
+    # Required by the microservice, but set by each test
+    FLAGS.set_default("analysis_dir", tempfile.gettempdir())
+    absltest.main()
@@ -0,0 +1,59 @@
+# MIT License
+# 
+# Copyright (c) 2023 MEng-Team-Project
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+"""Request profiling testing."""
+
+import os
+import pstats
+import tempfile
+
+from absl.testing import absltest
+
+from traffic_ml.tests import utils
+from traffic_ml.lib.profiling import profile_call, top_functions, write_profile
+
+
+def slow_sum(n):
+    return sum(i * i for i in range(n))
+
+
+class TestProfiling(utils.TestCase):
+    def test_top_functions(self):
+        result, profiler = profile_call(slow_sum, 10000)
+        self.assertEqual(result, slow_sum(10000))
+        functions = top_functions(profiler, n=3)
+        self.assertEqual(len(functions), 3)
+        self.assertIn("slow_sum", functions[0]["function"])
+        times = [function["cumulative_time"] for function in functions]
+        self.assertEqual(times, sorted(times, reverse=True))
+
+    def test_write_profile(self):
+        _, profiler = profile_call(slow_sum, 10)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            first  = write_profile(profiler, tmp_dir, "routes-stream")
+            second = write_profile(profiler, tmp_dir, "routes-stream")
+            self.assertNotEqual(first, second)
+            self.assertTrue(os.path.basename(first).startswith("routes-stream-"))
+            self.assertGreater(pstats.Stats(first).total_calls, 0)
+
+
+if __name__ == "__main__":
+    absltest.main()
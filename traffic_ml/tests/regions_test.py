@@ -0,0 +1,104 @@
+# MIT License
+# 
+# Copyright (c) 2023 MEng-Team-Project
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+"""Route region assignment testing."""
+
+import numpy as np
+from absl.testing import absltest
+from shapely.geometry import Point, Polygon
+
+from traffic_ml.tests import utils
+from traffic_ml.lib.regions import \
+    classify_points, points_in_polygon, regions_hash, RegionMap
+
+REGIONS = {
+    "north": [[0, 0], [100, 0], [100, 40], [0, 40]],
+    "wedge": [[0, 0], [100, 100], [0, 100]],
+    "east":  [[80, 20], [120, 20], [120, 80], [80, 80]]
+}
+
+
+class TestRegions(utils.TestCase):
+    def setUp(self):
+        super(TestRegions, self).setUp()
+        rng = np.random.default_rng(0)
+        self.xs = rng.uniform(-10, 130, 500)
+        self.ys = rng.uniform(-10, 110, 500)
+
+    def test_matches_shapely_within(self):
+        polygons = {name: Polygon(coords) for name, coords in REGIONS.items()}
+        expected = []
+        for x, y in zip(self.xs, self.ys):
+            label = np.nan
+            for name, polygon in polygons.items():
+                if Point(x, y).within(polygon):
+                    label = name
+                    break
+            expected.append(label)
+        labels = classify_points(self.xs, self.ys, REGIONS)
+        self.assertEqual(
+            [l if isinstance(l, str) else None for l in labels],
+            [l if isinstance(l, str) else None for l in expected])
+
+    def test_ray_casting_matches_shapely(self):
+        for coords in REGIONS.values():
+            polygon  = Polygon(coords)
+            expected = [Point(x, y).within(polygon) for x, y in zip(self.xs, self.ys)]
+            np.testing.assert_array_equal(
+                points_in_polygon(self.xs, self.ys, coords), expected)
+
+    def test_region_map_matches_away_from_edges(self):
+        region_map = RegionMap(REGIONS, 130, 110, scale=1.0)
+        # Pixel centres are classified exactly
+        xs, ys = np.floor(self.xs) + 0.5, np.floor(self.ys) + 0.5
+        expected = classify_points(xs, ys, REGIONS)
+        labels   = region_map.classify(xs, ys)
+        self.assertEqual(
+            [l if isinstance(l, str) else None for l in labels],
+            [l if isinstance(l, str) else None for l in expected])
+
+    def test_region_map_outside_frame(self):
+        region_map = RegionMap(REGIONS, 100, 100, scale=0.25)
+        labels = region_map.classify([-1.0, 50.0, 500.0], [5.0, 10.0, 5.0])
+        self.assertTrue(np.isnan(labels[0]))
+        self.assertEqual(labels[1], "north")
+        self.assertTrue(np.isnan(labels[2]))
+
+    def test_region_map_invalid_scale(self):
+        for scale in [0, -1.0, float("nan")]:
+            with self.assertRaises(ValueError):
+                RegionMap(REGIONS, 100, 100, scale=scale)
+        with self.assertRaises(ValueError):
+            RegionMap(REGIONS, 1920, 1080, scale=100)
+        with self.assertRaises(ValueError):
+            RegionMap(REGIONS, 100, 100, max_cells=100)
+
+    def test_regions_hash_depends_on_order(self):
+        reordered = dict(reversed(list(REGIONS.items())))
+        self.assertEqual(regions_hash(REGIONS), regions_hash(dict(REGIONS)))
+        self.assertNotEqual(regions_hash(REGIONS), regions_hash(reordered))
+
+    def test_no_points(self):
+        self.assertEqual(len(classify_points([], [], REGIONS)), 0)
+
+
+if __name__ == "__main__":
+    absltest.main()
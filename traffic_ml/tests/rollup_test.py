@@ -0,0 +1,136 @@
+# MIT License
+# 
+# Copyright (c) 2023 MEng-Team-Project
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+"""Route time rollup testing."""
+
+import numpy as np
+import pandas as pd
+from absl.testing import absltest
+
+from traffic_ml.tests import utils
+from traffic_ml.lib.analytics import assign_intervals, route_counts
+from traffic_ml.lib.rollup import RouteRollup, MINUTE_US, COUNT_ORDER
+from traffic_ml.lib.trajectory import merge_endpoints
+
+DAY_US = 24 * 60 * MINUTE_US
+
+
+def random_route_times(n, seed=0):
+    rng = np.random.default_rng(seed)
+    # Half of the tracks start and end on or next to bucket boundaries
+    starts = rng.integers(0, DAY_US, n)
+    starts[::2] = rng.integers(0, 24 * 60, n - n // 2) * MINUTE_US + rng.integers(-1, 2, n - n // 2)
+    durations = rng.integers(0, 30 * MINUTE_US, n)
+    durations[::3] = rng.integers(0, 3, len(durations[::3])) * MINUTE_US
+    route_times_df = pd.DataFrame({
+        "label":        rng.choice(["car", "bus", "person"], n),
+        "det_id":       np.arange(n, dtype=float),
+        "start_region": rng.choice(["a", "b", "c", None], n),
+        "end_region":   rng.choice(["a", "b", "c"], n),
+        "start_time":   np.maximum(starts, 0),
+        "end_time":     np.maximum(starts, 0) + durations,
+        "n_points":     1
+    })
+    return route_times_df.sort_values(COUNT_ORDER)
+
+
+def count(route_times_df, floors, ceils, count_col=None, include_earlier=False):
+    route_times_df = route_times_df.assign(interval=assign_intervals(
+        route_times_df["start_time"].to_numpy(), route_times_df["end_time"].to_numpy(),
+        floors, ceils, include_earlier))
+    return route_counts(route_times_df, ["a", "b", "c"], ["a", "b", "c"], count_col)
+
+
+class TestRouteRollup(utils.TestCase):
+    def setUp(self):
+        super(TestRouteRollup, self).setUp()
+        self.route_times_df = random_route_times(5000)
+        self.rollup = RouteRollup(self.route_times_df)
+
+    def test_bucket_for(self):
+        floors = np.arange(4) * 15 * MINUTE_US
+        self.assertEqual(self.rollup.bucket_for(floors, floors + 15 * MINUTE_US - 1), 15 * MINUTE_US)
+        self.assertEqual(self.rollup.bucket_for(floors + MINUTE_US, floors + 16 * MINUTE_US - 1), MINUTE_US)
+        self.assertIsNone(self.rollup.bucket_for(floors + 1, floors + 15 * MINUTE_US))
+
+    def test_rollup_counts_match_tracks(self):
+        classes = ["car", "bus"]
+        tracks  = self.route_times_df[self.route_times_df["label"].isin(classes)]
+        for spacing_minutes, offset_minutes, n in [(1, 0, 300), (5, 7, 50), (15, 30, 96), (60, 0, 24), (120, 60, 5)]:
+            floors = (offset_minutes + np.arange(n) * spacing_minutes) * MINUTE_US
+            ceils  = floors + spacing_minutes * MINUTE_US - 1
+            for include_earlier in [False, True]:
+                route_times_df, bucket_us = self.rollup.route_times(floors, ceils, classes)
+                self.assertIsNotNone(bucket_us)
+                self.assertLess(len(route_times_df), len(tracks))
+                self.assertEqual(
+                    count(route_times_df, floors, ceils, "count", include_earlier),
+                    count(tracks, floors, ceils, None, include_earlier))
+
+    def test_unaligned_intervals_use_tracks(self):
+        floors = np.arange(10) * 90 * 1000000 + 5
+        ceils  = floors + 90 * 1000000 - 1
+        route_times_df, bucket_us = self.rollup.route_times(floors, ceils, ["car"])
+        self.assertIsNone(bucket_us)
+        tracks = self.route_times_df[self.route_times_df["label"] == "car"]
+        self.assertEqual(count(route_times_df, floors, ceils, "count"), count(tracks, floors, ceils))
+
+    def test_last_end_time(self):
+        last = self.route_times_df[self.route_times_df["label"] == "bus"]["end_time"].iloc[-1]
+        self.assertEqual(self.rollup.last_end_time(["bus"]), last)
+        with self.assertRaises(IndexError):
+            self.rollup.last_end_time(["truck"])
+
+    def test_extend_matches_rebuild(self):
+        # Later detections of existing tracks and new tracks, in few enough
+        # hours for only their buckets to be rolled up again
+        rng      = np.random.default_rng(1)
+        extended = self.route_times_df[self.route_times_df["start_time"] >= 21 * 60 * MINUTE_US].sample(50, random_state=1)
+        delta_df = pd.concat([
+            extended.assign(start_time=extended["end_time"] + 1,
+                            end_time=extended["end_time"] + MINUTE_US,
+                            end_region=rng.choice(["a", "b", "c"], len(extended))),
+            random_route_times(20, seed=1).assign(det_id=np.arange(5000, 5020, dtype=float),
+                                                  start_time=21 * 60 * MINUTE_US,
+                                                  end_time=22 * 60 * MINUTE_US)
+        ]).sort_values(["label", "det_id"])
+
+        routes_df = merge_endpoints(self.route_times_df.sort_values(["label", "det_id"]), delta_df)
+        extended  = self.rollup.extend(delta_df)
+        rebuilt   = RouteRollup(routes_df)
+        routes_df = routes_df.sort_values(COUNT_ORDER)
+        floors = np.arange(96) * 15 * MINUTE_US
+        ceils  = floors + 15 * MINUTE_US - 1
+        for classes in [["car", "bus"], ["person"]]:
+            for rollup_df, rebuilt_df in zip(extended.route_times(floors, ceils, classes),
+                                             rebuilt.route_times(floors, ceils, classes)):
+                if isinstance(rollup_df, pd.DataFrame):
+                    pd.testing.assert_frame_equal(rollup_df.reset_index(drop=True),
+                                                  rebuilt_df.reset_index(drop=True))
+            self.assertEqual(extended.last_end_time(classes), rebuilt.last_end_time(classes))
+        self.assertEqual(count(extended.route_times(floors, ceils, ["bus"])[0], floors, ceils, "count"),
+                         count(routes_df[routes_df["label"] == "bus"], floors, ceils))
+        # The rollup extended is unchanged
+        self.assertEqual(len(self.rollup.routes), 5000)
+
+
+if __name__ == "__main__":
+    absltest.main()
@@ -0,0 +1,108 @@
+# MIT License
+# 
+# Copyright (c) 2023 MEng-Team-Project
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+"""Direct and incremental JSON encoding testing."""
+
+import json
+
+import numpy as np
+import pandas as pd
+from absl.testing import absltest
+
+from traffic_ml.tests import utils
+from traffic_ml.lib import serialize
+from traffic_ml.lib.serialize import dumps, iter_records, iter_object, encode_cursor, \
+    decode_cursor
+
+
+class TestSerialize(utils.TestCase):
+    def setUp(self):
+        super(TestSerialize, self).setUp()
+        self.df = pd.DataFrame({
+            "frame": np.arange(25),
+            "label": ["car", "bus", None, "person", "car"] * 5,
+            "conf":  np.linspace(0, 1, 25)
+        })
+        self.records = [
+            {"frame": frame, "label": label, "conf": conf}
+            for frame, label, conf in zip(range(25), self.df["label"], self.df["conf"])]
+
+    def test_dumps(self):
+        obj = {"records": self.df, "series": self.df["conf"].iloc[:2], "nan": np.nan,
+               "array": np.array([1.5, np.inf]), "int": np.int64(2)}
+        expected = {
+            "records": self.records, "series": {"0": 0.0, "1": self.df["conf"][1]},
+            "nan": None, "array": [1.5, None], "int": 2}
+        self.assertEqual(json.loads(dumps(obj)), expected)
+
+        # The standard library encoder is used without orjson, and mixed type
+        # Series hold NumPy scalars
+        row = pd.DataFrame({"fps": [30.0], "width": [640], "name": ["x"]}).iloc[0]
+        orjson, serialize.orjson = serialize.orjson, None
+        try:
+            self.assertEqual(json.loads(dumps(obj)), expected)
+            self.assertEqual(json.loads(dumps({"m": row})),
+                             {"m": {"fps": 30.0, "width": 640, "name": "x"}})
+        finally:
+            serialize.orjson = orjson
+
+    def test_precision(self):
+        obj = {"records": self.df.iloc[:3], "value": 1.23456}
+        self.assertEqual(json.loads(dumps(obj, precision=2)), {
+            "records": [{"frame": 0, "label": "car", "conf": 0.0},
+                        {"frame": 1, "label": "bus", "conf": 0.04},
+                        {"frame": 2, "label": None,  "conf": 0.08}],
+            "value": 1.23})
+
+    def test_records(self):
+        # Raw records are encoded by pandas, to 15 decimal places
+        expected = json.loads(self.df.to_json(orient="records", double_precision=15))
+        for chunk_rows in (1, 7, 25, 100):
+            text = b"".join(iter_records(self.df, chunk_rows))
+            self.assertEqual(json.loads(text), expected)
+
+    def test_empty_records(self):
+        self.assertEqual(b"".join(iter_records(self.df.iloc[:0])), b"[]")
+
+    def test_object(self):
+        text = b"".join(iter_object({"a": np.nan}, "raw", [b"[1,", b"2]"]))
+        self.assertEqual(json.loads(text), {"a": None, "raw": [1, 2]})
+        self.assertEqual(json.loads(b"".join(iter_object({}, "raw", [b"[]"]))), {"raw": []})
+
+    def test_invalid_precision(self):
+        # Raised when called rather than once streaming has started
+        for precision in [16, -1, 1.5, "x", True]:
+            with self.assertRaises(ValueError):
+                dumps({"a": 1.0}, precision)
+            with self.assertRaises(ValueError):
+                iter_records(self.df, precision=precision)
+            with self.assertRaises(ValueError):
+                iter_object({"a": 1.0}, "raw", [b"[]"], precision)
+
+    def test_cursor(self):
+        key = [np.int64(3), np.float64(1.0), "car"]
+        self.assertEqual(decode_cursor(encode_cursor(key)), [3, 1.0, "car"])
+        with self.assertRaises(ValueError):
+            decode_cursor("not a cursor")
+
+
+if __name__ == "__main__":
+    absltest.main()
@@ -0,0 +1,50 @@
+# MIT License
+# 
+# Copyright (c) 2023 MEng-Team-Project
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+"""WSGI server selection testing."""
+
+from unittest import mock
+
+from absl.testing import absltest
+
+from traffic_ml.tests import utils
+from traffic_ml.lib import serving
+from traffic_ml.lib.serving import choose_server
+
+
+class TestChooseServer(utils.TestCase):
+    def test_single_thread(self):
+        self.assertEqual(choose_server(1, 1), "flask")
+
+    def test_installed_servers(self):
+        with mock.patch.object(serving, "gunicorn", object()):
+            self.assertEqual(choose_server(4, 1), "gunicorn")
+        with mock.patch.object(serving, "gunicorn", None), \
+             mock.patch.object(serving, "waitress", object()):
+            self.assertEqual(choose_server(1, 8), "waitress")
+            self.assertEqual(choose_server(4, 2), "waitress")
+        with mock.patch.object(serving, "gunicorn", None), \
+             mock.patch.object(serving, "waitress", None):
+            self.assertEqual(choose_server(4, 2), "flask")
+
+
+if __name__ == "__main__":
+    absltest.main()
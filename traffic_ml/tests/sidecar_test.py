@@ -0,0 +1,109 @@
+# MIT License
+# 
+# Copyright (c) 2023 MEng-Team-Project
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+"""Columnar detection sidecar testing."""
+
+import os
+import sqlite3
+import tempfile
+
+import numpy as np
+import pandas as pd
+from absl.testing import absltest
+
+from traffic_ml.tests import utils
+from traffic_ml.lib.db import read_detections
+from traffic_ml.lib.sidecar import write_sidecar, read_sidecar, sidecar_path
+
+DETECTIONS = pd.DataFrame({
+    "frame":  [1, 1, 2, 3],
+    "label":  ["car", None, "car", "bus"],
+    "det_id": [0.0, 1.0, 0.0, np.nan],
+    "bbox_x": [10.0, 20.0, 12.0, 14.0],
+    "conf":   [0.9, 0.5, 0.8, 0.7]
+})
+
+
+class TestSidecar(utils.TestCase):
+    def setUp(self):
+        super(TestSidecar, self).setUp()
+        self.tmp  = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "stream.db")
+        con = sqlite3.connect(self.path)
+        DETECTIONS.to_sql("detection", con, index=False)
+        con.close()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+        super(TestSidecar, self).tearDown()
+
+    def read(self):
+        con = sqlite3.connect(self.path)
+        try:
+            return read_detections(con), read_sidecar(self.path, con)
+        finally:
+            con.close()
+
+    def test_missing(self):
+        _, sidecar = self.read()
+        self.assertIsNone(sidecar)
+
+    def test_matches_database(self):
+        self.assertEqual(write_sidecar(self.path), len(DETECTIONS))
+        self.assertTrue(os.path.isdir(sidecar_path(self.path)))
+        expected, (detections_df, watermark) = self.read()
+        pd.testing.assert_frame_equal(detections_df, expected)
+        self.assertEqual(watermark, (4, 3, "bus", None))
+        # Numeric columns are views of the memory-mapped files
+        self.assertIsInstance(detections_df["frame"].to_numpy().base, np.memmap)
+
+    def test_appended_detections_keep_sidecar(self):
+        write_sidecar(self.path)
+        con = sqlite3.connect(self.path)
+        DETECTIONS.to_sql("detection", con, index=False, if_exists="append")
+        con.close()
+        _, (detections_df, watermark) = self.read()
+        self.assertLen(detections_df, len(DETECTIONS))
+        self.assertEqual(watermark[0], 4)
+
+    def test_rewritten_database(self):
+        write_sidecar(self.path)
+        con = sqlite3.connect(self.path)
+        with con:
+            con.execute("DELETE FROM detection;")
+        DETECTIONS.iloc[::-1].to_sql("detection", con, index=False, if_exists="append")
+        con.close()
+        _, sidecar = self.read()
+        self.assertIsNone(sidecar)
+
+    def test_rewrite_replaces_sidecar(self):
+        write_sidecar(self.path)
+        con = sqlite3.connect(self.path)
+        DETECTIONS.to_sql("detection", con, index=False, if_exists="append")
+        con.close()
+        self.assertEqual(write_sidecar(self.path), 2 * len(DETECTIONS))
+        expected, (detections_df, _) = self.read()
+        pd.testing.assert_frame_equal(detections_df, expected)
+        self.assertCountEqual(os.listdir(self.tmp.name), ["stream.db", "stream.columns"])
+
+
+if __name__ == "__main__":
+    absltest.main()
@@ -0,0 +1,105 @@
+# MIT License
+# 
+# Copyright (c) 2023 MEng-Team-Project
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+"""Vectorized trajectory helpers testing."""
+
+import pandas as pd
+from absl.testing import absltest
+
+from traffic_ml.tests import utils
+from traffic_ml.lib.trajectory import add_anchors, track_endpoints, page_order, endpoint_page, \
+    track_points, routes_by_label, endpoint_routes_by_label
+
+DETECTIONS = pd.DataFrame({
+    "frame":  [1, 1, 2, 2, 3, 4],
+    "label":  ["car", "bus", "car", "bus", "car", "car"],
+    "det_id": [1.0, 0.0, 1.0, 0.0, 1.0, 2.0],
+    "bbox_x": [0.0, 10.0, 2.0, 12.0, 4.0, 50.0],
+    "bbox_y": [0.0, 10.0, 0.0, 10.0, 0.0, 50.0],
+    "bbox_w": [2.0, 4.0, 2.0, 4.0, 2.0, 10.0],
+    "bbox_h": [2.0, 4.0, 2.0, 4.0, 2.0, 10.0]
+})
+
+
+class TestTrajectory(utils.TestCase):
+    def setUp(self):
+        super(TestTrajectory, self).setUp()
+        self.routes_df = add_anchors(DETECTIONS)
+
+    def test_anchors(self):
+        self.assertEqual(self.routes_df["anchor_x"].tolist(), [1.0, 12.0, 3.0, 14.0, 5.0, 55.0])
+        self.assertNotIn("anchor_x", DETECTIONS)
+
+    def test_endpoints_match_groupby(self):
+        endpoints = track_endpoints(self.routes_df)
+        grouped   = self.routes_df.groupby(["label", "det_id"])
+        self.assertEqual(endpoints["start_x"].tolist(), grouped["anchor_x"].first().tolist())
+        self.assertEqual(endpoints["end_frame"].tolist(), grouped["frame"].last().tolist())
+        self.assertEqual(endpoints["n_points"].tolist(), grouped.size().tolist())
+        self.assertEqual(list(zip(endpoints["label"], endpoints["det_id"])),
+                         list(grouped.groups.keys()))
+
+    def test_points_match_groupby_apply(self):
+        columns  = ["frame", "anchor_x", "anchor_y"]
+        points   = track_points(self.routes_df, columns)
+        expected = self.routes_df.groupby(["label", "det_id"]).apply(
+            lambda group: group[columns].values.tolist())
+        self.assertEqual(points.tolist(), expected.tolist())
+        self.assertEqual(points.index.tolist(), expected.index.tolist())
+
+    def test_first_last_routes(self):
+        route_dict = routes_by_label(self.routes_df, "first_last")
+        self.assertEqual(sorted(route_dict.keys()), ["bus", "car"])
+        self.assertEqual(len(route_dict["car"]), 2)
+        self.assertEqual([p["frame:"] for p in route_dict["car"][0]], [1.0, 3.0])
+        # Single point tracks repeat their only point
+        self.assertEqual(route_dict["car"][1][0], route_dict["car"][1][1])
+
+    def test_endpoint_routes(self):
+        self.assertEqual(
+            endpoint_routes_by_label(track_endpoints(self.routes_df)),
+            routes_by_label(self.routes_df, "first_last"))
+
+    def test_endpoint_pages(self):
+        endpoints = page_order(track_endpoints(self.routes_df))
+        page_df, key = endpoint_page(endpoints, limit=2)
+        self.assertEqual(page_df["det_id"].tolist(), [0.0, 1.0])
+        self.assertEqual(key, [1, 1.0, "car"])
+        page_df, key = endpoint_page(endpoints, key, limit=2)
+        self.assertEqual(page_df["det_id"].tolist(), [2.0])
+        self.assertIsNone(key)
+
+        # Tracks starting in the same frame are split between pages
+        det_ids, key = [], None
+        while True:
+            page_df, key = endpoint_page(endpoints, key, limit=1)
+            det_ids += page_df["det_id"].tolist()
+            if key is None:
+                break
+        self.assertEqual(det_ids, [0.0, 1.0, 2.0])
+
+    def test_empty(self):
+        self.assertEqual(len(track_endpoints(self.routes_df.iloc[:0])), 0)
+        self.assertEqual(routes_by_label(self.routes_df.iloc[:0], "entire"), {})
+
+
+if __name__ == "__main__":
+    absltest.main()